@@ -0,0 +1,205 @@
+import math
+from fractions import Fraction
+
+try:
+    import av
+except ImportError:
+    av = None
+
+# Seconds between the end of one clip and the start of the next above which seeking to the next
+# clip is cheaper than decoding the gap
+SEEK_GAP = 5.0
+
+# How far (in frames) a frame can be late before ffmpeg repeats the previous one
+MAX_SLOT_DRIFT = 1.1
+
+# (videopath, container) of the last source this worker opened. Clips of the same source usually
+# come one after the other, so keeping the demuxer open saves opening and probing it for every clip
+current_source = None
+
+
+def open_source(videopath):
+    global current_source
+    if current_source is not None and current_source[0] == videopath:
+        return current_source[1]
+
+    close_source()
+    container = av.open(videopath)
+    if container.streams.video:
+        container.streams.video[0].thread_type = "AUTO"
+    current_source = (videopath, container)
+    return container
+
+
+def close_source():
+    global current_source
+    if current_source is not None:
+        current_source[1].close()
+        current_source = None
+
+
+# One clip being written. Video is re-encoded with libx264 (same defaults as the ffmpeg backend)
+# and audio packets are copied. Frames are placed on a constant frame rate grid the way ffmpeg does
+# when writing mp4: one frame per slot, frames that fall more than MAX_SLOT_DRIFT behind are
+# dropped and gaps of more than that (e.g. before the source starts for a clip with a negative
+# start) are filled by repeating the previous frame
+class ClipWriter:
+    def __init__(self, clip, start, end, video_stream, audio_stream, threads=None):
+        self.clip = clip
+        self.start = start
+        self.end = end
+        self.video_done = False
+        self.audio_done = audio_stream is None
+
+        self.output = av.open(clip["output"], "w", format="mp4")
+
+        self.frame_rate = video_stream.average_rate
+        # Frames from this slot on are past -t
+        self.slot_limit = (end - start) * self.frame_rate
+        self.next_slot = None
+        self.last_frame = None
+
+        self.video = self.output.add_stream("libx264", rate=self.frame_rate)
+        self.video.width = video_stream.codec_context.width
+        self.video.height = video_stream.codec_context.height
+        self.video.pix_fmt = video_stream.codec_context.pix_fmt or "yuv420p"
+        self.video.codec_context.time_base = 1 / self.frame_rate
+        if threads:
+            self.video.codec_context.thread_count = threads
+
+        self.audio = None
+        if audio_stream is not None:
+            self.audio_time_base = audio_stream.time_base
+            self.audio = self.output.add_stream_from_template(audio_stream)
+
+    @property
+    def done(self):
+        return self.video_done and self.audio_done
+
+    def write_frame(self, frame, time):
+        position = (time - self.start) * self.frame_rate
+        if position < 0:
+            return
+
+        # ffmpeg starts the grid at the requested start when the audio starts there, and at the
+        # first frame when there is no audio
+        if self.next_slot is None:
+            self.next_slot = 0 if self.audio is not None else round_half_up(position)
+
+        drift = position - self.next_slot
+        if drift < -MAX_SLOT_DRIFT:
+            return
+        if drift > MAX_SLOT_DRIFT:
+            for _ in range(round_half_up(drift)):
+                self.encode_frame(self.last_frame or frame)
+        self.encode_frame(frame)
+        self.last_frame = frame
+
+    def encode_frame(self, frame):
+        if self.next_slot >= self.slot_limit:
+            self.video_done = True
+            return
+
+        frame.pts = self.next_slot
+        frame.time_base = 1 / self.frame_rate
+        for packet in self.video.encode(frame):
+            self.output.mux(packet)
+        self.next_slot += 1
+
+    def write_audio(self, packet, time):
+        if time >= self.end:
+            self.audio_done = True
+            return
+        if time < max(self.start, 0):
+            return
+
+        # mux takes the packet's data, so every clip gets its own copy
+        copy = av.Packet(bytes(packet))
+        copy.pts = round((time - self.start) / self.audio_time_base)
+        copy.dts = copy.pts
+        copy.duration = packet.duration
+        copy.time_base = self.audio_time_base
+        copy.stream = self.audio
+        self.output.mux(copy)
+
+    def close(self):
+        for packet in self.video.encode(None):
+            self.output.mux(packet)
+        self.output.close()
+
+
+# Rounds halves up like ffmpeg rescaling timestamps
+def round_half_up(value):
+    return math.floor(value + Fraction(1, 2))
+
+
+# Exactly the -ss/-t arguments the ffmpeg backend passes, as fractions so frame and packet times
+# compare against them without float error
+def get_clip_range(clip):
+    start = Fraction(f"{clip['start']:.2f}")
+    return start, start + Fraction(f"{clip['end'] - clip['start']:.2f}")
+
+
+# Extracts clips that all come from the same source inside this process with PyAV instead of one
+# ffmpeg process per clip. The source is demuxed once from the earliest clip: every decoded frame
+# goes to each clip whose [start, end) contains it (tap clips overlap), and the demuxer only seeks
+# again when the next clip starts more than SEEK_GAP seconds after the current ones finished.
+# threads: optional libx264 thread count from the adaptive scheduler
+def extract_clips_av(clips, threads=None):
+    container = open_source(clips[0]["videopath"])
+    video_stream = container.streams.video[0]
+    audio_stream = container.streams.audio[0] if container.streams.audio else None
+    streams = [video_stream] + ([audio_stream] if audio_stream is not None else [])
+
+    pending = sorted(
+        ((*get_clip_range(clip), i) for i, clip in enumerate(clips)),
+        key=lambda clip_range: clip_range[:2],
+    )
+    active = []
+
+    def open_writers(time):
+        while pending and pending[0][0] <= time:
+            start, end, i = pending.pop(0)
+            active.append(ClipWriter(clips[i], start, end, video_stream, audio_stream, threads))
+
+    def close_writers():
+        done = [writer for writer in active if writer.done]
+        for writer in done:
+            writer.close()
+            active.remove(writer)
+        return len(done)
+
+    at_end = False
+    while pending and not at_end:
+        seek = max(pending[0][0], 0)
+        container.seek(int(seek / video_stream.time_base), stream=video_stream, backward=True)
+
+        at_end = True
+        time = seek
+        for packet in container.demux(streams):
+            if packet.stream is audio_stream:
+                if packet.pts is None:
+                    continue
+                time = packet.pts * audio_stream.time_base
+                open_writers(time)
+                for writer in active:
+                    writer.write_audio(packet, time)
+            else:
+                for frame in packet.decode():
+                    if frame.pts is None:
+                        continue
+                    time = frame.pts * video_stream.time_base
+                    open_writers(time)
+                    for writer in active:
+                        writer.write_frame(frame, time)
+            # Only seek once the clips in flight are finished, never right after seeking (the
+            # keyframe before a clip can be further than SEEK_GAP from it)
+            if close_writers() and not active and (not pending or pending[0][0] - time > SEEK_GAP):
+                at_end = False
+                break
+
+    # Clips that run past the end of the source (or start after it) still get written
+    for start, end, i in pending:
+        active.append(ClipWriter(clips[i], start, end, video_stream, audio_stream, threads))
+    for writer in active:
+        writer.close()
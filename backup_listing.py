@@ -0,0 +1,52 @@
+import os
+
+TIMESTAMPS_SUFFIX = "-timestamps.jpg"
+VIDEO_SUFFIX = ".mp4"
+
+
+# ._ files are the AppleDouble metadata macOS leaves next to every file it copies
+def is_timestamps_file(filename):
+    return filename.endswith(TIMESTAMPS_SUFFIX) and not os.path.basename(filename).startswith("._")
+
+
+# Streams the timestamps files of backup_dir (relative to it) whose .mp4 is in the same directory,
+# as soon as both were seen, so planning starts before a directory of 100k+ entries is fully
+# listed. Directories are read with os.scandir and the entry types come from the directory entries,
+# so nothing is stat'ed (except symlinks, and on filesystems that don't report entry types).
+# Only the names still waiting for their other half are kept in memory. recursive: also list every
+# subdirectory, after the directory itself. missing: optional list the timestamps files without a
+# video are appended to once their directory is listed
+def iter_timestamp_files(backup_dir, recursive=False, missing=None):
+    directories = [""]
+    while directories:
+        directory = directories.pop()
+        timestamps = set()
+        videos = set()
+        subdirectories = []
+
+        with os.scandir(os.path.join(backup_dir, directory)) as entries:
+            for entry in entries:
+                name = entry.name
+                if name.startswith("._"):
+                    continue
+
+                if name.endswith(TIMESTAMPS_SUFFIX) and entry.is_file():
+                    stem = name[:-len(TIMESTAMPS_SUFFIX)]
+                    if stem in videos:
+                        videos.remove(stem)
+                        yield os.path.join(directory, name)
+                    else:
+                        timestamps.add(stem)
+                elif name.endswith(VIDEO_SUFFIX) and entry.is_file():
+                    stem = name[:-len(VIDEO_SUFFIX)]
+                    if stem in timestamps:
+                        timestamps.remove(stem)
+                        yield os.path.join(directory, stem + TIMESTAMPS_SUFFIX)
+                    else:
+                        videos.add(stem)
+                elif recursive and entry.is_dir():
+                    subdirectories.append(os.path.join(directory, name))
+
+        if missing is not None:
+            missing.extend(os.path.join(directory, stem + TIMESTAMPS_SUFFIX) for stem in sorted(timestamps))
+        directories.extend(sorted(subdirectories, reverse=True))
@@ -0,0 +1,77 @@
+import datetime
+import os
+import threading
+
+from decode_ledger import connect_database
+from description_parser import clean_sign
+
+
+# Catalog row of a finished clip, with its path relative to --dest_dir and the sign as it is in the
+# clip paths (e.g. "dont" for "don't"), which is what the annotation tools filter and group on
+def get_catalog_row(dest_dir, batch, clip):
+    return (
+        os.path.relpath(clip["output"], dest_dir),
+        batch,
+        clip["uid"],
+        clean_sign(clip["sign"]),
+        clip.get("attempt"),
+        bool(clip["is_valid"]),
+        bool(clip["reject"]),
+        round(clip["end"] - clip["start"], 3),
+        os.path.getsize(clip["output"]),
+        clip["videopath"],
+    )
+
+
+# SQLite catalog of every clip in --dest_dir with what the annotation tools filter and page on,
+# so flask_app can serve a batch from an indexed query instead of walking the clip directories.
+# Rows are added as clips finish, from the producer and the pool's result thread, so like the ledger
+# the connection is shared between threads behind a lock
+class ClipCatalog:
+    def __init__(self, path, dest_dir, batch):
+        self.dest_dir = dest_dir
+        self.batch = batch
+        self.lock = threading.Lock()
+        self.connection = connect_database(path)
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS clips (
+                path TEXT PRIMARY KEY,
+                batch TEXT NOT NULL,
+                uid TEXT NOT NULL,
+                sign TEXT NOT NULL,
+                attempt INTEGER,
+                is_valid INTEGER NOT NULL,
+                rejected INTEGER NOT NULL,
+                duration REAL NOT NULL,
+                size INTEGER NOT NULL,
+                source TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS clips_batch_sign ON clips (batch, sign, uid, path);
+            CREATE INDEX IF NOT EXISTS clips_uid_sign ON clips (uid, sign, path);
+            CREATE INDEX IF NOT EXISTS clips_sign ON clips (sign, path);
+            """
+        )
+        self.connection.commit()
+
+    # Adds (or updates, for clips extracted again) the rows of clips whose output exists. With
+    # replace=False existing rows are kept, for clips an earlier run already catalogued
+    def add(self, clips, replace=True):
+        updated_at = datetime.datetime.now().isoformat(timespec="seconds")
+        rows = [
+            (*get_catalog_row(self.dest_dir, self.batch, clip), updated_at)
+            for clip in clips
+            if os.path.exists(clip["output"])
+        ]
+        with self.lock:
+            self.connection.executemany(
+                f"INSERT OR {'REPLACE' if replace else 'IGNORE'} INTO clips (path, batch, uid, sign, attempt, is_valid, rejected, duration, size, source, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self.connection.commit()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,46 @@
+import json
+
+# Every clip in a manifest has these fields, see decode_split_by_length.plan_clips
+MANIFEST_FIELDS = ("uid", "sign", "filename", "videopath", "start", "end", "is_valid", "reject", "output")
+
+# Written when the clip has them, manifests from before they were added don't
+OPTIONAL_MANIFEST_FIELDS = ("attempt",)
+
+
+def get_manifest_entry(clip):
+    entry = {field: clip[field] for field in MANIFEST_FIELDS}
+    entry.update((field, clip[field]) for field in OPTIONAL_MANIFEST_FIELDS if field in clip)
+    return entry
+
+
+# Writes one JSON object per clip (JSONL) so the manifest can be streamed, grepped, split into
+# shards or filtered with jq before running execute on it. Returns the number of clips written
+def write_manifest(path, clips):
+    count = 0
+    with open(path, "w") as f:
+        for clip in clips:
+            f.write(json.dumps(get_manifest_entry(clip)) + "\n")
+            count += 1
+    return count
+
+
+# Appends the index entries (thumbnails, frames) of a finished job to a JSONL index. Clips that are
+# extracted again get a new entry, the last entry of a clip is the current one
+def append_index_entries(path, entries):
+    with open(path, "a") as f:
+        f.write("".join(json.dumps(entry) + "\n" for entry in entries))
+
+
+# Yields the clips of a manifest written by write_manifest. Blank lines and # comments are skipped
+def read_manifest(path):
+    with open(path) as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+
+            clip = json.loads(line)
+            missing = [field for field in MANIFEST_FIELDS if field not in clip]
+            if missing:
+                raise ValueError(f"{path}:{line_number}: clip is missing {', '.join(missing)}")
+            yield clip
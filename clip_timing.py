@@ -0,0 +1,147 @@
+import datetime
+
+import numpy as np
+
+# Recorder timestamps look like 2023_05_01_10_00_01.500 (%Y_%m_%d_%H_%M_%S.mmm)
+TIMESTAMP_LENGTH = 23
+ISO_SEPARATORS = {4: "-", 7: "-", 10: "T", 13: ":", 16: ":"}
+
+# Recordings longer than this were made by holding the button down instead of tapping
+HOLD_THRESHOLD_US = 1_000_000
+
+# Checks of validate_clip_ranges that drop a clip instead of only flagging it
+DROP_CHECKS = ("bad_timestamp", "empty_range", "before_video_start", "past_video_end")
+
+# Seconds of float error allowed when comparing a clip with the previous one
+OVERLAP_TOLERANCE = 1e-6
+
+
+# Converts recorder timestamps to datetime64[us] in one batch by rewriting the separators to ISO
+# 8601 in a byte matrix and letting NumPy parse them. If any of them isn't in the usual fixed width
+# format they all go through strptime one by one, like the old per clip path. Timestamps that
+# don't parse at all are NaT, so one broken recording doesn't take the whole session down
+def parse_timestamps(timestamps):
+    if all(len(timestamp) == TIMESTAMP_LENGTH for timestamp in timestamps):
+        raw = np.array(timestamps, dtype=f"S{TIMESTAMP_LENGTH}")
+        chars = raw.view(np.uint8).reshape(len(raw), TIMESTAMP_LENGTH).copy()
+        for position, separator in ISO_SEPARATORS.items():
+            chars[:, position] = ord(separator)
+        try:
+            return chars.view(f"S{TIMESTAMP_LENGTH}").ravel().astype("datetime64[us]")
+        except ValueError:
+            pass
+
+    return np.array([parse_timestamp(timestamp) for timestamp in timestamps], dtype="datetime64[us]")
+
+
+def parse_timestamp(timestamp):
+    try:
+        return datetime.datetime.strptime(timestamp + "000", "%Y_%m_%d_%H_%M_%S.%f")
+    except (TypeError, ValueError):
+        return np.datetime64("NaT")
+
+
+# Same value as timedelta.seconds + timedelta.microseconds / 1e6, which is what the clip offsets
+# have always been computed with. Note timedelta.seconds drops whole days, so a negative offset
+# wraps around to just under 86400 instead of going negative
+def to_subclip_seconds(delta_us):
+    return (delta_us // 1_000_000) % 86400 + (delta_us % 1_000_000) / 1e6
+
+
+# Computes the clip ranges of every recording of a session at once. The inputs are the recorder
+# timestamp strings of the recordings sorted by sign start. buffer_start/buffer_end/invert can be
+# scalars or per recording arrays (e.g. per uid settings from config.json).
+#
+# Holds (sign_end - sign_start > 1s) use their own sign boundaries. Taps start at the previous
+# recording's sign end (or the video start for the first recording) and end at their sign start.
+# Returns (start_subclip, end_subclip, is_hold) arrays, start/end in seconds from the video start.
+# Clips that depend on a timestamp that didn't parse get NaN for both start and end
+def get_clip_ranges(video_starts, sign_starts, sign_ends, buffer_start, buffer_end, invert):
+    video_start = parse_timestamps(video_starts)
+    sign_start = parse_timestamps(sign_starts)
+    sign_end = parse_timestamps(sign_ends)
+
+    # A tap also needs the sign end of the recording before it
+    bad = np.isnat(video_start) | np.isnat(sign_start) | np.isnat(sign_end)
+    prev_bad = np.empty_like(bad)
+    prev_bad[1:] = np.isnat(sign_end[:-1])
+    prev_bad[:1] = False
+
+    video_start = video_start.astype(np.int64)
+    sign_start = sign_start.astype(np.int64)
+    sign_end = sign_end.astype(np.int64)
+
+    is_hold = ~bad & (sign_end - sign_start > HOLD_THRESHOLD_US)
+    bad |= ~is_hold & prev_bad
+
+    prev_sign_end = np.empty_like(sign_end)
+    prev_sign_end[1:] = sign_end[:-1]
+    prev_sign_end[:1] = video_start[:1]
+
+    clip_start = np.where(is_hold, sign_start, prev_sign_end)
+    clip_end = np.where(is_hold, sign_end, sign_start)
+
+    start_subclip = to_subclip_seconds(clip_start - video_start)
+    end_subclip = to_subclip_seconds(clip_end - video_start)
+
+    start_subclip = np.where(invert, end_subclip + buffer_start, start_subclip + buffer_start)
+    end_subclip = end_subclip + buffer_end
+
+    start_subclip = np.where(bad, np.nan, start_subclip)
+    end_subclip = np.where(bad, np.nan, end_subclip)
+    return start_subclip, end_subclip, is_hold
+
+
+# Ends clips that run past the end of the source (e.g. the last sign with a positive --buffer) at the
+# end of the source. Clips that start after it are left alone
+def clamp_clip_ends(start_subclip, end_subclip, duration):
+    return np.where(start_subclip < duration, np.minimum(end_subclip, duration), end_subclip)
+
+
+# Pre-flight checks of the clip ranges of a session, all clips at once, so broken recorder metadata
+# is caught before any ffmpeg process is started. Returns the repaired end_subclip and a dict of
+# check name -> per clip flags:
+#   bad_timestamp: a recorder timestamp the clip depends on didn't parse (NaN range, see
+#                  get_clip_ranges)
+#   empty_range: the clip ends before it starts (e.g. --invert with a buffer_end below buffer_start)
+#   before_video_start: the sign starts before the video does
+#   past_video_end: the clip starts after the end of the source (needs duration)
+#   overlap: the clip starts further before the end of an earlier clip than the buffers allow
+#            (max_overlap = buffer_end - buffer_start), i.e. the recordings overlap. Dropped clips
+#            aren't compared against
+#   clamped_end: the clip ran past the end of the source and now ends with it (needs duration)
+# Clips flagged by one of the DROP_CHECKS should be dropped, the others are only reported
+def validate_clip_ranges(video_starts, sign_starts, start_subclip, end_subclip, max_overlap, duration=None):
+    video_start = parse_timestamps(video_starts)
+    sign_start = parse_timestamps(sign_starts)
+
+    bad_timestamp = np.isnan(start_subclip) | np.isnan(end_subclip)
+    checks = {
+        "bad_timestamp": bad_timestamp,
+        "empty_range": end_subclip <= start_subclip,
+        "before_video_start": ~bad_timestamp & (sign_start < video_start),
+    }
+    if duration is not None:
+        checks["past_video_end"] = start_subclip >= duration
+    dropped = get_dropped_clips(checks)
+
+    # Latest end of the clips before each clip that are kept
+    kept_end = np.where(dropped, -np.inf, end_subclip)
+    prev_end = np.empty_like(kept_end)
+    prev_end[1:] = np.maximum.accumulate(kept_end)[:-1]
+    prev_end[:1] = -np.inf
+    checks["overlap"] = ~dropped & (prev_end - start_subclip > max_overlap + OVERLAP_TOLERANCE)
+
+    if duration is not None:
+        checks["clamped_end"] = ~dropped & (end_subclip > duration)
+        end_subclip = clamp_clip_ends(start_subclip, end_subclip, duration)
+
+    return end_subclip, checks
+
+
+def get_dropped_clips(checks):
+    dropped = np.zeros(len(next(iter(checks.values()))), dtype=bool)
+    for check in DROP_CHECKS:
+        if check in checks:
+            dropped |= checks[check]
+    return dropped
@@ -0,0 +1,101 @@
+import datetime
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import urllib.parse
+
+# Clips are first written here and only renamed to their real path once ffmpeg succeeded, so a
+# half-written clip from a crashed run is never mistaken for a finished one
+PARTIAL_SUFFIX = ".part"
+
+# Seconds a connection waits for another process' write lock before giving up
+BUSY_TIMEOUT = 60
+
+
+def get_partial_path(output):
+    return output + PARTIAL_SUFFIX
+
+
+# Size and mtime of the source video, so a re-uploaded source invalidates its clips
+@functools.lru_cache(maxsize=4096)
+def get_source_signature(videopath):
+    stat = os.stat(videopath)
+    return stat.st_size, stat.st_mtime_ns
+
+
+# Identifies a clip by its source video, its range/output and the parameters it is cut with.
+# Changing any of them (e.g. a new --buffer or --cut_mode) re-extracts the clip. Paths are made
+# absolute so the same clip has the same key whatever directory the run was started from
+def get_clip_key(args, clip):
+    params = [
+        os.path.abspath(clip["videopath"]),
+        *get_source_signature(clip["videopath"]),
+        clip["start"],
+        clip["end"],
+        os.path.abspath(clip["output"]),
+        args.cut_mode,
+        args.use_cuda,
+        list(args.video_dim) if args.use_cuda or args.output_format == "npy" else None,
+    ]
+    return hashlib.sha1(json.dumps(params).encode()).hexdigest()
+
+
+# Connection to one of the run's SQLite files (ledger, caches, catalog), shared between threads.
+# These live in --dest_dir or other directories the array tasks of a run share, usually on NFS,
+# where WAL's shared memory index doesn't work across hosts, so they use SQLite's default rollback
+# journal (files an older version left in WAL mode are switched back) and wait for each other's
+# write locks instead. read_only: open an existing file without ever taking a write lock
+def connect_database(path, read_only=False):
+    if read_only:
+        uri = f"file:{urllib.parse.quote(os.path.abspath(path))}?mode=ro"
+        return sqlite3.connect(uri, uri=True, timeout=BUSY_TIMEOUT, check_same_thread=False)
+    connection = sqlite3.connect(path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=DELETE")
+    return connection
+
+
+# SQLite ledger of the clips that finished, kept in --dest_dir so a crashed or repeated run only
+# extracts the clips that are missing. Lookups happen in the producer and updates in the pool's
+# result thread, so the connection is shared between threads behind a lock
+class CompletionLedger:
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.connection = connect_database(path)
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS clips (
+                key TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                output TEXT NOT NULL,
+                start REAL NOT NULL,
+                end REAL NOT NULL,
+                finished_at TEXT NOT NULL
+            )
+            """
+        )
+        self.connection.commit()
+
+    # A clip only counts as done if its output is still there
+    def is_done(self, key, clip):
+        with self.lock:
+            row = self.connection.execute("SELECT 1 FROM clips WHERE key = ?", (key,)).fetchone()
+        return row is not None and os.path.exists(clip["output"])
+
+    def mark_done(self, keys, clips):
+        finished_at = datetime.datetime.now().isoformat(timespec="seconds")
+        with self.lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO clips (key, source, output, start, end, finished_at) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (key, clip["videopath"], clip["output"], clip["start"], clip["end"], finished_at)
+                    for key, clip in zip(keys, clips)
+                ],
+            )
+            self.connection.commit()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
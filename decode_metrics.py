@@ -0,0 +1,127 @@
+import contextlib
+import datetime
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Unit of every stage that gets recorded. extract_wall/extract_cpu are per job (one clip, or one
+# decode group with --extract_mode source), output_bytes is per clip
+STAGE_UNITS = {
+    "scan": "seconds",
+    "exif_read": "seconds",
+    "parse": "seconds",
+    "plan": "seconds",
+    "probe": "seconds",
+    "extract_wall": "seconds",
+    "extract_cpu": "seconds",
+    "output_bytes": "bytes",
+}
+
+
+def get_quantiles(values):
+    values = np.asarray(values, dtype=np.float64)
+    summary = {"count": int(len(values)), "sum": float(values.sum())}
+    for quantile in QUANTILES:
+        summary[f"p{round(quantile * 100)}"] = float(np.quantile(values, quantile))
+    return summary
+
+
+def escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels):
+    return ",".join(f'{name}="{escape_label_value(value)}"' for name, value in labels.items())
+
+
+# Collects per stage samples of a decode run, overall, per uid and totalled per source file.
+# Recording is just a list append under a lock so it can stay on for production runs; quantiles
+# are only computed when the report is written
+class DecodeMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.samples = defaultdict(list)
+        self.uid_samples = defaultdict(lambda: defaultdict(list))
+        self.sources = defaultdict(lambda: defaultdict(float))
+        self.uid_counts = defaultdict(lambda: defaultdict(int))
+
+    def record(self, stage, value, uid=None, source=None):
+        with self.lock:
+            self.samples[stage].append(value)
+            if uid is not None:
+                self.uid_samples[uid][stage].append(value)
+            if source is not None:
+                self.sources[source][stage] += value
+
+    def count(self, source, name, value=1, uid=None):
+        with self.lock:
+            self.sources[source][name] += value
+            if uid is not None:
+                self.uid_counts[uid][name] += value
+
+    @contextlib.contextmanager
+    def timer(self, stage, uid=None, source=None):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started, uid, source)
+
+    def summary(self):
+        with self.lock:
+            return {
+                "started": datetime.datetime.fromtimestamp(self.started).isoformat(timespec="seconds"),
+                "wall_seconds": time.time() - self.started,
+                "units": STAGE_UNITS,
+                "stages": {stage: get_quantiles(values) for stage, values in self.samples.items() if values},
+                "uids": {
+                    uid: {stage: get_quantiles(values) for stage, values in stages.items() if values}
+                    for uid, stages in self.uid_samples.items()
+                },
+                "uid_counts": {uid: dict(counts) for uid, counts in self.uid_counts.items()},
+                "sources": {source: dict(totals) for source, totals in self.sources.items()},
+            }
+
+    def write_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+    # Prometheus text exposition format, for node_exporter's textfile collector. Written to a
+    # temporary file and renamed so the collector never reads a half-written file
+    def write_prometheus(self, path):
+        summary = self.summary()
+        lines = [
+            "# HELP decode_run_wall_seconds Wall clock time of the decode run",
+            "# TYPE decode_run_wall_seconds gauge",
+            f"decode_run_wall_seconds {summary['wall_seconds']:.6f}",
+        ]
+
+        for unit in sorted(set(STAGE_UNITS.values())):
+            name = f"decode_stage_{unit}"
+            lines.append(f"# HELP {name} Per stage {unit} of the decode run, overall and per uid")
+            lines.append(f"# TYPE {name} summary")
+
+            series = [({}, summary["stages"])]
+            series += [({"uid": uid}, stages) for uid, stages in sorted(summary["uids"].items())]
+            for labels, stages in series:
+                for stage, values in sorted(stages.items()):
+                    if STAGE_UNITS.get(stage, "seconds") != unit:
+                        continue
+                    stage_labels = dict(labels, stage=stage)
+                    for quantile in QUANTILES:
+                        quantile_labels = format_labels(dict(stage_labels, quantile=quantile))
+                        lines.append(f"{name}{{{quantile_labels}}} {values[f'p{round(quantile * 100)}']:.6f}")
+                    lines.append(f"{name}_sum{{{format_labels(stage_labels)}}} {values['sum']:.6f}")
+                    lines.append(f"{name}_count{{{format_labels(stage_labels)}}} {values['count']}")
+
+        partial_path = path + ".tmp"
+        with open(partial_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(partial_path, path)
@@ -0,0 +1,105 @@
+import datetime
+import json
+import os
+import queue
+import threading
+import time
+from collections import Counter, defaultdict
+
+# Reason codes of the records in the report
+REASONS = {
+    "parse_failure": "timestamps description couldn't be parsed",
+    "single_sign_file": "timestamps file has at most one sign",
+    "missing_video": "source video of the timestamps file doesn't exist",
+    "invalid_recording": "recording was marked invalid by the recorder",
+    "bad_timestamp": "recorder timestamps of the file didn't parse, the clips depending on them were dropped",
+    "invalid_clip_range": "planned clip failed the pre-flight checks and was dropped",
+    "overlapping_clip": "clip overlaps the previous clip by more than the buffers allow",
+    "clamped_clip": "clip ran past the end of the source and was shortened",
+    "ffmpeg_failure": "clip extraction kept failing, the clip was written to the retry queue",
+}
+
+# Records are written once this many are queued, or FLUSH_INTERVAL seconds after the last write
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 1.0
+
+STOP = object()
+
+
+# Run-scoped sink for everything that goes wrong (or is skipped) during a decode run. Records are
+# put on a queue from any thread (the planning producer, the pool's result handler) and a single
+# writer thread appends them to one JSONL file in batches, instead of every record opening,
+# appending to and closing a text file. close() writes a per reason summary next to it
+class DecodeReport:
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.counts = Counter()
+        self.uid_counts = defaultdict(Counter)
+        self.path = None
+        self.thread = None
+        self.run = datetime.datetime.now().isoformat(timespec="seconds")
+
+    def open(self, path):
+        self.path = path
+        self.thread = threading.Thread(target=self.write_records, daemon=True)
+        self.thread.start()
+
+    def add(self, reason, **fields):
+        with self.lock:
+            self.counts[reason] += 1
+            if fields.get("uid") is not None:
+                self.uid_counts[fields["uid"]][reason] += 1
+        self.queue.put({"run": self.run, "reason": reason, **fields})
+
+    def write_records(self):
+        batch = []
+        last_write = time.monotonic()
+        with open(self.path, "a") as f:
+            while True:
+                try:
+                    record = self.queue.get(timeout=FLUSH_INTERVAL)
+                except queue.Empty:
+                    record = None
+
+                if record is not None and record is not STOP:
+                    batch.append(record)
+
+                if batch and (
+                    record is STOP
+                    or len(batch) >= BATCH_SIZE
+                    or time.monotonic() - last_write >= FLUSH_INTERVAL
+                ):
+                    f.write("".join(json.dumps(record) + "\n" for record in batch))
+                    f.flush()
+                    batch = []
+                    last_write = time.monotonic()
+
+                if record is STOP:
+                    return
+
+    def summary(self):
+        with self.lock:
+            return {
+                "run": self.run,
+                "report": self.path,
+                "total": sum(self.counts.values()),
+                "reasons": {reason: self.counts[reason] for reason in REASONS if self.counts[reason]},
+                "uids": {uid: dict(counts) for uid, counts in self.uid_counts.items()},
+            }
+    # Flushes every queued record and writes the summary to report_summary.json in the same directory
+    def close(self):
+        if self.thread is None:
+            return
+        self.queue.put(STOP)
+        self.thread.join()
+        self.thread = None
+
+        summary = self.summary()
+        with open(os.path.join(os.path.dirname(self.path), "report_summary.json"), "w") as f:
+            json.dump(summary, f, indent=2)
+
+        if summary["total"]:
+            print(f"{summary['total']} problems recorded in {self.path}:")
+            for reason, count in summary["reasons"].items():
+                print(f"  {reason}: {count} ({REASONS[reason]})")
@@ -1,29 +1,86 @@
-from PIL import Image
-from PIL.ExifTags import TAGS
 import datetime
 from tqdm import tqdm
 from multiprocess import Pool, Lock
-from collections import defaultdict
+from collections import defaultdict, deque
 
 import re
 import os
 import argparse
+import functools
+import glob
 import json
-
 import subprocess
+import threading
+import time
+import resource
+
+import numpy as np
+
+from av_backend import av, extract_clips_av
+from backup_listing import is_timestamps_file, iter_timestamp_files
+from clip_catalog import ClipCatalog
+from clip_manifest import append_index_entries, read_manifest, write_manifest
+from clip_timing import get_clip_ranges, get_dropped_clips, validate_clip_ranges
+from dedup_cache import DedupCache, link_output
+from decode_ledger import CompletionLedger, get_clip_key, get_partial_path
+from decode_metrics import DecodeMetrics
+from decode_report import DecodeReport
+from description_parser import DescriptionParseError, clean_sign, parse_description
+from exif_reader import read_image_description
+from frame_store import FRAMES_INDEX_FILENAME, extract_clip_frames, get_frames_index_entry
+from sharding import CLIP_OVERHEAD_COST, assign_shards, get_clip_cost, probe_duration
+from previews import get_preview_output_args, get_preview_path, get_preview_shell_args, make_preview
+from probe_cache import ProbeCache, SourceProber, get_smart_cut_probe
+from scheduler import AdaptiveScheduler, get_available_cpus
+from thumbnails import THUMBNAIL_INDEX_FILENAME, get_index_entry, get_thumbnail_output_args, get_thumbnail_paths, get_thumbnail_shell_args, make_thumbnails
+from retry_queue import get_backoff, get_failure, remove_partial_outputs, write_retry_queue
+from smart_cut import get_thread_args, probe_video_packets, run_captured, smart_cut_clip
+
+# With --probe, how many listed timestamps files the probes of their sources are submitted ahead of planning
+PROBE_AHEAD = 64
 
 log_lock = Lock()
+metrics = DecodeMetrics()
+report = DecodeReport()
+# SourceProber of the run with --probe
+prober = None
 
 
 def parse_args():
     parser = argparse.ArgumentParser()
 
+    parser.add_argument(
+        "command",
+        nargs="?",
+        choices=["run", "plan", "execute", "scan"],
+        default="run",
+        help="run plans and extracts every clip (default), plan only writes the clips to --manifest, execute extracts the clips in --manifest, scan only writes an inventory of the recordings to dest_dir/inventory.json",
+    )
     parser.add_argument("--job_array_num", required=False, type=int) #Matthew said not to worry about this
-    parser.add_argument("--backup_dir", required=True, type=str, help="Also known as the source directory")
+    parser.add_argument("--num_shards", type=int, default=None, help="Split the work into this many shards balanced by estimated encode cost and only process shard --job_array_num (default $SLURM_ARRAY_TASK_ID)")
+    parser.add_argument(
+        "--shard_cost",
+        choices=["clips", "probe"],
+        default="clips",
+        help="clips estimates the cost of a session from its clip durations in the timestamps, probe from the duration of the source video",
+    )
+    parser.add_argument("--backup_dir", dest="backup_dirs", nargs="+", default=[], help="Also known as the source directory. Several directories are run through one worker pool")
+    parser.add_argument("--wave_root", type=str, default=None, help="Directory of per uid backup directories, e.g. /data/sign_language_videos/review_313/fourth_wave")
+    parser.add_argument("--uids", nargs="+", default=["*"], help="With --wave_root, the uid directories to decode (glob patterns allowed, default all)")
+    parser.add_argument("--recursive", action="store_true", help="Also look for timestamps files in the subdirectories of every backup dir (e.g. per day folders)")
     parser.add_argument("--dest_dir", required=True, type=str)
-    parser.add_argument("--video_dim", nargs=2, type=int, default=(1080, 1920))
+    parser.add_argument("--manifest", type=str, default=None, help="Clip manifest written by plan and read by execute (default dest_dir/manifest.jsonl)")
+    parser.add_argument("--video_dim", nargs=2, type=int, default=(1080, 1920), help="Width and height clips are scaled to with --use_cuda or --output_format npy")
+    parser.add_argument(
+        "--output_format",
+        choices=["mp4", "npy"],
+        default="mp4",
+        help="mp4 encodes every clip, npy decodes it to RGB frames scaled to --video_dim in an uncompressed .npy (same name) for training loaders, indexed in dest_dir/frames_index.jsonl. Every clip is decoded on its own, so npy doesn't work with --extract_mode source, --cut_mode smart, --backend av or --use_cuda",
+    )
     parser.add_argument("--log_file", type=str, default=None)
-    parser.add_argument("--skip_extraction", action="store_true")
+    parser.add_argument("--metrics_file", type=str, default=None, help="JSON report of the per stage timings (default log_file_metrics.json)")
+    parser.add_argument("--prometheus", action="store_true", help="Also write the timings to logs/decode_split_by_length.prom for node_exporter's textfile collector")
+    parser.add_argument("--skip_extraction", action="store_true", help="Same as the scan command")
     parser.add_argument(
         "--buffer",
         nargs=2,
@@ -35,9 +92,54 @@ def parse_args():
         "--invert", action="store_true", help="Switch start/end timestamps."
     )
     parser.add_argument("--num_threads", type=int, default=5)
+    parser.add_argument(
+        "--scheduler",
+        choices=["fixed", "adaptive"],
+        default="fixed",
+        help="fixed runs --num_threads ffmpeg processes with default threading, adaptive shares --cpu_budget cores between ffmpeg processes and picks -threads per job from measured throughput",
+    )
+    parser.add_argument("--cpu_budget", type=int, default=get_available_cpus(), help="With --scheduler adaptive, cores the ffmpeg processes may use together (default the cores this job may run on)")
+    parser.add_argument("--ledger", type=str, default=None, help="SQLite ledger of finished clips used to resume runs (default dest_dir/ledger.sqlite)")
+    parser.add_argument("--catalog", type=str, default=None, help="SQLite catalog of every clip in dest_dir (uid, sign, batch, attempt, validity, duration, size, path) served by flask_app (default dest_dir/catalog.sqlite)")
+    parser.add_argument("--batch", type=str, default=None, help="Batch the clips are catalogued under (default the name of dest_dir)")
+    parser.add_argument("--restart", action="store_true", help="Ignore the ledger and re-extract every clip")
+    parser.add_argument("--dedup_cache", type=str, default=None, help="SQLite cache of extracted clips keyed by source content, shared between runs, dest_dirs and waves. Clips it already has are hardlinked instead of extracted again")
+    parser.add_argument("--probe", action="store_true", help="Probe every source once (duration, frame rate, streams, keyframes) ahead of extraction, to clamp clips to the end of the source, give smart cuts their keyframes and estimate shard costs")
+    parser.add_argument("--probe_cache", type=str, default=None, help="SQLite cache of the probes, reused by later runs (default dest_dir/probe_cache.sqlite)")
+    parser.add_argument("--probe_threads", type=int, default=4, help="ffprobe processes run at once with --probe")
+    parser.add_argument("--retries", type=int, default=2, help="Times a clip whose extraction failed is tried again before it goes to the retry queue")
+    parser.add_argument("--retry_backoff", type=float, default=1.0, help="Seconds before the first retry of a clip, doubled for every retry after it")
+    parser.add_argument("--retry_queue", type=str, default=None, help="JSONL manifest the clips that kept failing are appended to, with their ffmpeg errors. Run it again with execute --manifest (and another --retry_queue) once the sources are fixed (default dest_dir/retry_queue.jsonl)")
+    parser.add_argument("--queue_size", type=int, default=None, help="Max jobs queued for the worker pool at once (default 4 per worker: 4 * num_threads, or 4 * the adaptive scheduler's pool size)")
     parser.add_argument("--make_structured_dirs", action="store_true", help="Creates directories in the format of (uid)(sign)/sign_start_time-recording_idx.mp4 instead of uid-sign-video_start_time-recording_idx.mp4")
     parser.add_argument("--make_sign_dirs", action="store_true", help="Creates directories in the format of (sign)/uid-sign-sign_start_time-recording_idx.mp4")
     parser.add_argument("--use_cuda", type=bool, default=False, help="Use CUDA acceleration")
+    parser.add_argument(
+        "--extract_mode",
+        choices=["clip", "source"],
+        default="clip",
+        help="clip runs one ffmpeg per clip, source decodes each source video once and writes all of its clips in one pass",
+    )
+    parser.add_argument(
+        "--cut_mode",
+        choices=["encode", "smart"],
+        default="encode",
+        help="encode re-encodes every clip with libx264, smart stream copies whole GOPs and only re-encodes the partial GOPs at the head/tail (implies --probe)",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["ffmpeg", "av"],
+        default="ffmpeg",
+        help="ffmpeg runs an ffmpeg process per clip (or per source with --extract_mode source), av decodes/encodes inside the worker with PyAV and keeps the source open between clips",
+    )
+    parser.add_argument("--clips_per_decode", type=int, default=0, help="With --extract_mode source, max clips written per ffmpeg process (0 = all clips of a source)")
+    parser.add_argument("--previews", action="store_true", help="Also write a small faststart, keyframe dense preview of every clip to --preview_dir for the annotation UI")
+    parser.add_argument("--preview_dir", type=str, default=None, help="Tree mirroring dest_dir the previews are written to (default dest_dir_preview)")
+    parser.add_argument("--preview_height", type=int, default=360)
+    parser.add_argument("--thumbnails", action="store_true", help="Also write a poster frame and a sprite sheet of every clip to --thumbnail_dir, indexed in thumbnail_dir/index.jsonl")
+    parser.add_argument("--thumbnail_dir", type=str, default=None, help="Tree mirroring dest_dir the thumbnails are written to (default dest_dir_thumbnails)")
+    parser.add_argument("--thumbnail_width", type=int, default=160)
+    parser.add_argument("--sprite_frames", type=int, default=10, help="Evenly spaced frames in each sprite sheet")
     parser.add_argument("--old_filenames", action="store_true", help="Use old format of {uid}-{sign}-{video_start_time}-{recording_idx}.mp4 instead of sign_start_time")
     parser.add_argument(
         "--ffmpeg_loglevel",
@@ -57,170 +159,82 @@ def parse_args():
 
     
     args = parser.parse_args()
+    if args.skip_extraction and args.command == "run":
+        args.command = "scan"
+
+    if args.wave_root is not None:
+        for pattern in args.uids:
+            uid_dirs = sorted(path for path in glob.glob(os.path.join(args.wave_root, pattern)) if os.path.isdir(path))
+            if not uid_dirs:
+                parser.error(f"--uids {pattern} matches no directory in {args.wave_root}")
+            args.backup_dirs += [path for path in uid_dirs if path not in args.backup_dirs]
+
+    if args.command != "execute" and not args.backup_dirs:
+        parser.error("--backup_dir or --wave_root is required unless running execute")
+
+    if args.backend == "av":
+        if av is None:
+            parser.error("--backend av needs PyAV (pip install av)")
+        if args.cut_mode == "smart" or args.use_cuda:
+            parser.error("--backend av doesn't support --cut_mode smart or --use_cuda")
+
+    # npy clips are always decoded one by one (see frame_store.extract_clip_frames)
+    if args.output_format == "npy":
+        if args.extract_mode == "source" or args.backend == "av" or args.cut_mode == "smart" or args.use_cuda:
+            parser.error("--output_format npy doesn't support --extract_mode source, --backend av, --cut_mode smart or --use_cuda")
+        if args.previews or args.thumbnails:
+            parser.error("--previews and --thumbnails need --output_format mp4")
+
+    if args.thumbnails and args.sprite_frames < 1:
+        parser.error("--sprite_frames must be at least 1")
+
+    # Smart cuts need the keyframes of their source, which --probe reads once per source instead of
+    # once per clip
+    if args.cut_mode == "smart":
+        args.probe = True
+
+    if args.num_shards is not None:
+        if args.job_array_num is None and "SLURM_ARRAY_TASK_ID" in os.environ:
+            args.job_array_num = int(os.environ["SLURM_ARRAY_TASK_ID"])
+        if args.job_array_num is None or not 0 <= args.job_array_num < args.num_shards:
+            parser.error("--num_shards needs a --job_array_num between 0 and num_shards - 1")
     return args
 
 
-def get_image_description(exifdata):
-    description = ""
-    # iterating over all EXIF data fields
-    for tag_id in exifdata:
-        # get the tag name, instead of human unreadable tag id
-        tag = TAGS.get(tag_id, tag_id)
-        data = exifdata.get(tag_id)
-        # decode bytes
-        if isinstance(data, bytes):
-            data = data.decode()
-        # print(f"{tag:25}: {data}")
-        if tag == "ImageDescription":
-            description = data
-
-    #print("Image Description:", description)
-    return description
-
 error_count = 0
-def get_data_from_description(description, error_log='/data/Mobile-Data-Processing-Pipeline/decode_split_by_length.log'):
+def get_data_from_description(description, filename=None, uid=None):
     is_valid_exists = "isValid" in description
 
-    subbed = re.sub(r"file=(.*?),", r'"\1",', description)
-    subbed = re.sub(r"videoStart=(.*?),", r'"\1",', subbed)
-    subbed = re.sub(r"signStart=(.*?),", r'"\1",', subbed)
-
-    if is_valid_exists:
-        subbed = re.sub(r"signEnd=(.*?),", r'"\1",', subbed)
-        subbed = re.sub(r"isValid=(.*?),", r'\1,', subbed)
-    else:
-        subbed = re.sub(r"signEnd=(.*?),", r'"\1")', subbed)
-
-    #Purposely break things for now
-    subbed = re.sub(r'\\/', '/', subbed) # Replace all instances of \\/ with /
-    subbed = re.sub(r'"\[', '[', subbed) # Replaces all instances of "[ with [
-    subbed = re.sub(r'\]"', ']', subbed) # Replaces all instances of ]" with ]
-    subbed = re.sub(r'\\r', '', subbed) # Remove all return carriages
-    subbed = re.sub(r'\."', '"', subbed) # Remove all periods at the end of phrases
-
-    subbed = re.sub(r'attempt=(.*?)', r'\1', subbed) #Remove the attribute "attempt=*" as it was causing issues in terms of decoding
-    subbed = re.sub(r'isValid=(.*?)', r'\1', subbed) #Remove the attribute "IsValid=True" -> "True" for similar reason as above
-    
-    subbed = clean_contractions(subbed) # Replace common contractions to ensure json parses correctly
-
     # There are often many errors when it comes to parsing the files
     # Don't want to kill the process simply because there was one corrupt file
     # Only kill if 50 files fail to load
     try:
-        data = eval(subbed)
-    except:
+        data = parse_description(description)
+    except DescriptionParseError as e:
         global error_count
         error_count += 1
-        log = open(error_log, "w")
-        log.write(subbed)
+        report.add("parse_failure", file=filename, uid=uid, error=e.message, position=e.position, detail=str(e))
         if (error_count > 50):
-            raise("Decode Error. 50 files failed to decode")
+            raise RuntimeError("Decode Error. 50 files failed to decode")
         return -1, -1
 
     return data, is_valid_exists
 
 
-def clean_sign(sign):
-    sign = sign.replace(" / ", "")
-    sign = sign.replace(" ", "")
-    sign = sign.replace("-", "")
-    sign = sign.replace(",", "")
-    sign = sign.replace("(", "")
-    sign = sign.replace(")", "")
-    sign = sign.replace("'", "") # Maybe replacing single quotes won't break everything?
-    return sign
-
-#Only cleaning up stuff that appears in review_313 right now
-def clean_contractions(input_string):
-    #When parsing strings that use '' as boundary markers, replace apostrophes
-    #in common contractions with \'
-    
-    #input_string = input_string.replace('don\'t', 'dont')
-    #input_string = input_string.replace('pet\'s name', 'pets name')
-    input_string = re.sub(r'pet\'s name', 'pets name', input_string)
-    input_string = re.sub(r'don\'t', 'dont', input_string)
-    return input_string
-
-
-# Extracts a video clip if the user held down the button instead of tapping
-# args: CLI arguments; uid: User ID of the sign; recording_idx: attempt # of the sign;
-def extract_clip_from_video_hold(
-        args, uid, sign, recording_idx, recording, videopath, is_valid_exists, reject=False
-):
+def load_config():
     with open("config.json") as f:
-        config = json.load(f)
+        return json.load(f)
 
-    #print("Recording: ", recording)
-    if is_valid_exists:
-        signName, filename, video_start_time, sign_start_time, sign_end_time, is_valid, attempt = recording
-    else:
-        signName, filename, video_start_time, sign_start_time, sign_end_time = recording
-        is_valid = True
-
-    video_start_time_date = datetime.datetime.strptime(
-        video_start_time + "000", "%Y_%m_%d_%H_%M_%S.%f"
-    )
-    sign_start_time_date = datetime.datetime.strptime(
-        sign_start_time + "000", "%Y_%m_%d_%H_%M_%S.%f"
-    )
-    sign_end_time_date = datetime.datetime.strptime(
-        sign_end_time + "000", "%Y_%m_%d_%H_%M_%S.%f"
-    )
-    sign = clean_sign(sign)
-
-    #if is_valid:
-    #    print(sign_end_time_date - sign_start_time_date)
-    # print(
-    #     "Video Info: ", sign, filename, video_start_time, sign_start_time, sign_end_time
-    # )
-
-    start_seconds = sign_start_time_date - video_start_time_date
-    end_seconds = sign_end_time_date - video_start_time_date
-
-    start_subclip = start_seconds.seconds + start_seconds.microseconds / 1e6
-    end_subclip = end_seconds.seconds + end_seconds.microseconds / 1e6
-
-    if uid in config:
-        
-        buffer_0 = config[uid]["buffer_start"]
-        buffer_1 = config[uid]["buffer_end"]
-        invert = config[uid]["invert"]
-        #print(f"Found {uid} in config.json")
-        #print(f"SIGN, filename: {sign}, {filename}")
-        #print(f"Start_subclip, end_subclip: {start_subclip}, {end_subclip}\n Buffer: ({buffer_0}, {buffer_1})")
-        if invert:
-            start_subclip = end_subclip + buffer_0
-            end_subclip += buffer_1
-        else:
-            start_subclip += buffer_0
-            end_subclip += buffer_1
-        #print(f"New Start_subclip, end_subclip: {start_subclip}, {end_subclip}")
-
-    else:
-        #print(f"Could not find {uid} in config.json file")
-        #print(f"SIGN, filename: {sign}, {filename}")
-        #print(f"Start_subclip, end_subclip: {start_subclip}, {end_subclip}\n Buffer: ({args.buffer[0]}, {args.buffer[1]})")
-        if args.invert:
-            start_subclip = end_subclip + args.buffer[0]
-            end_subclip += args.buffer[1]
-        else:
-           
-            start_subclip += args.buffer[0]
-            end_subclip += args.buffer[1]
-        #print(f"New Start_subclip, end_subclip: {start_subclip}, {end_subclip}")
-
-            
-    output_dir = args.dest_dir
-    
 
+# Works out where a clip should be written based on --make_structured_dirs/--make_sign_dirs/--old_filenames,
+# creating the output directory if needed
+def get_output_path(args, uid, sign, recording_idx, video_start_time, sign_start_time, invalid=False):
     if args.make_structured_dirs:
         video_filename = f"{sign_start_time}-{recording_idx}.mp4"
         output_dir = os.path.join(args.dest_dir, f"{uid}", f"{sign}")
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
     elif args.make_sign_dirs:
-        
-
+        #ONCE YOU ARE DONE PROCESSING unrecognizables, change this to sign start time
+        #But need to have it to video_start_time to have same file names as before :/
         if args.old_filenames:
             video_filename = f"{uid}-{sign}-{video_start_time}-{recording_idx}.mp4"
         else:
@@ -229,201 +243,164 @@ def extract_clip_from_video_hold(
         print(f"Sign: {sign}:\n\targs.old_filenames: {args.old_filenames}, video_filename: {video_filename}\n\tvideo_start_time: {video_start_time}, sign_start_time: {sign_start_time}")
 
         output_dir = os.path.join(args.dest_dir, f"{sign}")
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
     else:
         output_dir = args.dest_dir
-        #print("Filename Struct: ", uid, sign, video_start_time, recording_idx)
         video_filename = f"{uid}-{sign}-{video_start_time}-{recording_idx}.mp4"
-    
-    
-    if not is_valid:
-        output_dir = os.path.join(args.dest_dir, "invalid", f"{sign}")
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
 
-    time = end_subclip - start_subclip
-    full_filename = os.path.join(output_dir, video_filename)
+    # --output_format npy keeps the same names with the .npy extension
+    if args.output_format == "npy":
+        video_filename = os.path.splitext(video_filename)[0] + ".npy"
 
-    if args.use_cuda:
-        subprocess.run(
-            [
-                "ffmpeg",
-                "-hwaccel",
-                "cuda",
-                "-hwaccel_output_format",
-                "cuda",
-                "-i",
-                videopath,
-                "-vf",
-                f"scale={str(args.video_dim[0])}:{str(args.video_dim[1])}",
-                "-ss",
-                start_subclip.strftime("%H:%M:%S.%f")[:-3],
-                "-t",
-                end_subclip.strftime("%H:%M:%S.%f")[:-3],
-                "-c:v",
-                "hevc_nvenc",
-                "-c:a",
-                "copy",
-                str(full_filename),
-                "-loglevel",
-                args.ffmpeg_loglevel,
-            ]
-        )
-    else:
-        args = (
-            f"ffmpeg -y -nostdin -ss {start_subclip:.2f} -i {videopath} "
-            f"-t {time:.2f} -c:v libx264 {full_filename}"
-        )
-
-        # Call ffmpeg directly
-        subprocess.run(args, shell=True, check=True) 
+    # Only plan doesn't create the directories, execute creates them as the clips are written
+    create_dirs = args.command != "plan"
 
-    if is_valid:
-        return True, None, None
-    return False, filename, signName
+    if create_dirs and not os.path.exists(output_dir):
+        os.makedirs(output_dir, exist_ok=True)
 
+    # Invalid/rejected recordings are still useful data, so they go to the invalid folder instead
+    if invalid:
+        output_dir = os.path.join(args.dest_dir, "invalid", f"{sign}")
+        if create_dirs and not os.path.exists(output_dir):
+            os.makedirs(output_dir, exist_ok=True)
 
-def extract_clip_from_video(
-        args, uid, sign, recording_idx, recording, prevRecording, videopath, is_valid_exists, reject=False
-):
-    with open("config.json") as f:
-        config = json.load(f)
+    return os.path.join(output_dir, video_filename)
 
-    #("Recording: ", recording)
-    #print("Previous Recording: ", prevRecording)
 
-    if is_valid_exists:
-        signName, filename, video_start_time, sign_start_time, sign_end_time, is_valid, attempt = recording
-    else:
-        signName, filename, video_start_time, sign_start_time, sign_end_time = recording
-        is_valid = True
-
-    #Commenting this out since we still want to look at videos that are invalid since it could be useful data
-    #if not is_valid:
-    #    return False, filename, signName
-
-    sign_start_time_date = datetime.datetime.strptime(
-        sign_start_time + "000", "%Y_%m_%d_%H_%M_%S.%f"
-    )
-    sign_end_time_date = datetime.datetime.strptime(
-        sign_end_time + "000", "%Y_%m_%d_%H_%M_%S.%f"
+# (buffer_start, buffer_end, invert) of a uid, from config.json if it has the uid
+def get_recording_buffers(args, config, uid):
+    if uid in config:
+        return config[uid]["buffer_start"], config[uid]["buffer_end"], config[uid]["invert"]
+    buffer_start, buffer_end = args.buffer
+    return buffer_start, buffer_end, args.invert
+
+
+# Clip ranges of the (sign, file, video_start, sign_start, sign_end, is_valid, attempt) recordings of a
+# session, using the per uid buffers from config.json if there are any
+def get_recording_ranges(args, config, uid, recordings):
+    buffer_start, buffer_end, invert = get_recording_buffers(args, config, uid)
+
+    return get_clip_ranges(
+        [recording[2] for recording in recordings],
+        [recording[3] for recording in recordings],
+        [recording[4] for recording in recordings],
+        buffer_start,
+        buffer_end,
+        invert,
     )
 
-    if sign_end_time_date - sign_start_time_date > datetime.timedelta(seconds=1):
-        return extract_clip_from_video_hold(args, uid, sign, recording_idx, recording, videopath, is_valid_exists, reject)
-
-    # To split based on taps, we set the current sign's start time to be the previous sign's end time
-    if (prevRecording is not None):
-        prevSignName, prevFilename, prev_video_start_time, prev_sign_start_time, prev_sign_end_time, prev_is_valid, prev_attempt = prevRecording
-
-        temp = sign_start_time
-        sign_start_time = prev_sign_end_time
-        sign_end_time = temp
-    else:
-        temp = sign_start_time
-        sign_start_time = video_start_time
-        sign_end_time = temp
 
-    video_start_time_date = datetime.datetime.strptime(
-        video_start_time + "000", "%Y_%m_%d_%H_%M_%S.%f"
-    )
-    sign_start_time_date = datetime.datetime.strptime(
-        sign_start_time + "000", "%Y_%m_%d_%H_%M_%S.%f"
+# get_recording_ranges followed by the pre-flight checks of clip_timing.validate_clip_ranges.
+# Returns (start_subclips, end_subclips, is_hold, checks, dropped), end_subclips clamped to the
+# source's duration when it's known
+def get_checked_recording_ranges(args, config, uid, recordings, duration=None):
+    start_subclips, end_subclips, is_hold = get_recording_ranges(args, config, uid, recordings)
+    buffer_start, buffer_end, _ = get_recording_buffers(args, config, uid)
+    end_subclips, checks = validate_clip_ranges(
+        [recording[2] for recording in recordings],
+        [recording[3] for recording in recordings],
+        start_subclips,
+        end_subclips,
+        buffer_end - buffer_start,
+        duration,
     )
-    sign_end_time_date = datetime.datetime.strptime(
-        sign_end_time + "000", "%Y_%m_%d_%H_%M_%S.%f"
-    )
-    sign = clean_sign(sign)
-
-    #print(
-    #    "Video Info: ", sign, filename, video_start_time, sign_start_time, sign_end_time
-    #)
-
-    start_seconds = sign_start_time_date - video_start_time_date
-    end_seconds = sign_end_time_date - video_start_time_date
+    return start_subclips, end_subclips, is_hold, checks, get_dropped_clips(checks)
+
+
+# Reports the clips of a session that failed the pre-flight checks: clips with recorder timestamps
+# that don't parse once for the whole file as bad_timestamp, other dropped clips as
+# invalid_clip_range, overlapping and shortened clips as overlapping_clip/clamped_clip
+def report_clip_checks(uid, videopath, recordings, start_subclips, end_subclips, checks, dropped):
+    bad_timestamp = checks["bad_timestamp"]
+    if bad_timestamp.any():
+        report.add(
+            "bad_timestamp", uid=uid, videopath=videopath,
+            signs=[recordings[i][0] for i in np.flatnonzero(bad_timestamp)],
+        )
 
-    start_subclip = start_seconds.seconds + start_seconds.microseconds / 1e6
-    end_subclip = end_seconds.seconds + end_seconds.microseconds / 1e6
+    for i in np.flatnonzero(np.any(list(checks.values()), axis=0) & ~bad_timestamp):
+        failed = [check for check, flags in checks.items() if flags[i]]
+        fields = dict(
+            uid=uid, sign=recordings[i][0], videopath=videopath, checks=failed,
+            start=float(start_subclips[i]), end=float(end_subclips[i]),
+        )
+        if dropped[i]:
+            report.add("invalid_clip_range", **fields)
+            continue
+        if checks["overlap"][i]:
+            report.add("overlapping_clip", **fields)
+        if "clamped_end" in checks and checks["clamped_end"][i]:
+            report.add("clamped_clip", **fields)
+
+
+# Plans the clips of every recording of a session without running ffmpeg. recordings are the
+# (sign, file, video_start, sign_start, sign_end, is_valid, attempt) tuples from sort_recordings and
+# the timestamp math is done for all of them at once (see clip_timing.get_clip_ranges). Each clip is
+# a dict with the source video, the (start, end) offsets in seconds and the output path of the clip.
+# reject: optional per recording flags for recordings that should go to the invalid folder.
+# duration: optional duration of the source from --probe, clips that run past it end with it.
+# Clips that fail the pre-flight checks are reported and only the valid ones are planned
+def plan_clips(args, config, uid, recordings, videopath, reject=None, duration=None):
+    start_subclips, end_subclips, is_hold, checks, dropped = get_checked_recording_ranges(
+        args, config, uid, recordings, duration
+    )
+    report_clip_checks(uid, videopath, recordings, start_subclips, end_subclips, checks, dropped)
 
+    clips = []
+    for i, recording in enumerate(recordings):
+        if dropped[i]:
+            continue
 
-    if uid in config:
-        
-        buffer_0 = config[uid]["buffer_start"]
-        buffer_1 = config[uid]["buffer_end"]
-        invert = config[uid]["invert"]
-        #print(f"Found {uid} in config.json")
-        #print(f"SIGN, filename: {sign}, {filename}")
-        #print(f"Start_subclip, end_subclip: {start_subclip}, {end_subclip}\n Buffer: ({buffer_0}, {buffer_1})")
-        if invert:
-            start_subclip = end_subclip + buffer_0
-            end_subclip += buffer_1
-        else:
-            start_subclip += buffer_0
-            end_subclip += buffer_1
-        #print(f"New Start_subclip, end_subclip: {start_subclip}, {end_subclip}")
+        signName, filename, video_start_time, sign_start_time, sign_end_time, is_valid, attempt = recording
 
-    else:
-        #print(f"Could not find {uid} in config.json file")
-        #print(f"SIGN, filename: {sign}, {filename}")
-        #print(f"Start_subclip, end_subclip: {start_subclip}, {end_subclip}\n Buffer: ({args.buffer[0]}, {args.buffer[1]})")
-        if args.invert:
-            start_subclip = end_subclip + args.buffer[0]
-            end_subclip += args.buffer[1]
+        if is_hold[i]:
+            # The user held down the button instead of tapping, so the recording already has the sign boundaries
+            invalid = not is_valid
         else:
-           
-            start_subclip += args.buffer[0]
-            end_subclip += args.buffer[1]
-        #print(f"New Start_subclip, end_subclip: {start_subclip}, {end_subclip}")
-
+            # To split based on taps, we set the current sign's start time to be the previous sign's end time
+            sign_start_time = recordings[i - 1][4] if i > 0 else video_start_time
 
-    output_dir = args.dest_dir
+            # We still want to look at videos that are invalid since it could be useful data,
+            # so only rejected videos are put in the invalid folder
+            invalid = reject is not None and reject[i]
 
-    if args.make_structured_dirs:
-        video_filename = f"{sign_start_time}-{recording_idx}.mp4"
-        output_dir = os.path.join(args.dest_dir, f"{uid}", f"{sign}")
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-    elif args.make_sign_dirs:
-        #ONCE YOU ARE DONE PROCESSING unrecognizables, change this to sign start time
-        #But need to have it to video_start_time to have same file names as before :/
-        
-
-        if args.old_filenames:
-            video_filename = f"{uid}-{sign}-{video_start_time}-{recording_idx}.mp4"
-        else:
-            video_filename = f"{uid}-{sign}-{sign_start_time}-{recording_idx}.mp4"
+        sign = clean_sign(signName)
+        # recording_idx is the attempt # of the sign
+        output_path = get_output_path(
+            args, uid, sign, attempt, video_start_time, sign_start_time, invalid
+        )
 
-        print(f"Sign: {sign}:\n\targs.old_filenames: {args.old_filenames}, video_filename: {video_filename}\n\tvideo_start_time: {video_start_time}, sign_start_time: {sign_start_time}")
+        clips.append({
+            "uid": uid,
+            "sign": signName,
+            "filename": filename,
+            "videopath": videopath,
+            "start": float(start_subclips[i]),
+            "end": float(end_subclips[i]),
+            "output": output_path,
+            "is_valid": is_valid,
+            "reject": bool(invalid),
+            "attempt": attempt,
+        })
 
-        output_dir = os.path.join(args.dest_dir, f"{sign}")
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-    else:
-        output_dir = args.dest_dir
-        #print("Filename Struct: ", uid, sign, video_start_time, recording_idx)
-        video_filename = f"{uid}-{sign}-{video_start_time}-{recording_idx}.mp4"
+    return clips
 
-    # Only take the first video for a particular sign because subsequent ones tend to be bad
-    # Okay recording_idx corresponds to the number of attempts, but as discussed with Sahir
-    # this seems to be redudant with the valid attribute, so I am going to ignore this for now
-    #if recording_idx != 0:
-    #    output_dir = os.path.join(args.dest_dir, "error")
 
-    # If the video is to be rejected, put it in the reject folder instead
-    if reject:
-        output_dir = os.path.join(args.dest_dir, "invalid", f"{sign}")
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
+def get_clip_result(clip):
+    if clip["is_valid"]:
+        return True, None, None
+    return False, clip["filename"], clip["sign"]
 
-    # if not is_valid:
-    #     output_dir = os.path.join(args.dest_dir, "error")
 
-    time = end_subclip - start_subclip
-    full_filename = os.path.join(output_dir, video_filename)
+# probe: optional probe_video_packets result for the source, so --cut_mode smart only probes each source once
+# threads: optional ffmpeg -threads picked by --scheduler adaptive
+def run_clip(args, clip, probe=None, threads=None):
+    start_subclip = clip["start"]
+    time = clip["end"] - clip["start"]
+    videopath = clip["videopath"]
+    full_filename = clip["output"]
 
     if args.use_cuda:
-        subprocess.run(
+        run_captured(
             [
                 "ffmpeg",
                 "-hwaccel",
@@ -435,32 +412,119 @@ def extract_clip_from_video(
                 "-vf",
                 f"scale={str(args.video_dim[0])}:{str(args.video_dim[1])}",
                 "-ss",
-                start_subclip.strftime("%H:%M:%S.%f")[:-3],
+                f"{start_subclip:.2f}",
                 "-t",
-                end_subclip.strftime("%H:%M:%S.%f")[:-3],
+                f"{time:.2f}",
                 "-c:v",
                 "hevc_nvenc",
                 "-c:a",
                 "copy",
+                "-f",
+                "mp4",
                 str(full_filename),
                 "-loglevel",
                 args.ffmpeg_loglevel,
             ]
         )
-
-        
-    else:
+    elif not (
+        args.cut_mode == "smart"
+        and smart_cut_clip(videopath, start_subclip, time, full_filename, args.ffmpeg_loglevel, probe, threads)
+    ):
+        # Smart cut falls back to a full re-encode when the clip doesn't contain a whole GOP
+        thread_args = " ".join(get_thread_args(threads))
+        # Previews and thumbnails are more outputs of the same decode
+        preview_args = ""
+        if "preview" in clip:
+            preview_args = f" -t {time:.2f} " + get_preview_shell_args(args.preview_height, clip["preview"], threads)
+        if "sprite" in clip:
+            preview_args += " " + get_thumbnail_shell_args(
+                args.thumbnail_width, args.sprite_frames, time, clip["poster"], clip["sprite"]
+            )
         args = (
-            f"ffmpeg -y -nostdin -ss {start_subclip:.2f} -i {videopath} "
-            f"-t {time:.2f} -c:v libx264 {full_filename}"
+            f"ffmpeg -y -nostdin {thread_args} -ss {start_subclip:.2f} -i {videopath} "
+            f"-t {time:.2f} -c:v libx264 {thread_args} -f mp4 {full_filename}{preview_args}"
         )
 
         # Call ffmpeg directly
-        subprocess.run(args, shell=True, check=True) 
+        run_captured(args, shell=True)
+
+    return get_clip_result(clip)
+
+
+# Read-only --probe cache of a pool worker, opened once by init_worker
+worker_probe_cache = None
+
+
+def init_worker(args):
+    global worker_probe_cache
+    if args.probe:
+        worker_probe_cache = ProbeCache(args.probe_cache, read_only=True)
 
-    if is_valid:
-        return True, None, None
-    return False, filename, signName
+
+# Video packets (with their keyframes) of a source for --cut_mode smart from the --probe cache, or
+# None if the source wasn't probed yet. Runs in the workers, which read the cache init_worker opened
+def get_cached_packets(args, videopath):
+    if worker_probe_cache is None:
+        return None
+    probe = worker_probe_cache.get(videopath)
+    return get_smart_cut_probe(probe) if probe is not None else None
+
+
+# Cuts every clip in clips out of the same source video with a single ffmpeg process, so the source
+# is opened, seeked and decoded once instead of once per clip. ffmpeg seeks to the earliest clip
+# and each output then uses its own output-side -ss/-t, which is frame accurate like the input seek
+# used by run_clip. Offsets are rounded the same way run_clip rounds them so the clips line up.
+def run_clips_from_source(args, clips, threads=None):
+    if args.use_cuda:
+        return [run_clip(args, clip) for clip in clips]
+
+    # Smart cuts mostly copy packets instead of decoding, so only share the probe between clips
+    if args.cut_mode == "smart":
+        probe = get_cached_packets(args, clips[0]["videopath"]) or probe_video_packets(clips[0]["videopath"])
+        return [run_clip(args, clip, probe, threads) for clip in clips]
+
+    seek = min(round(clip["start"], 2) for clip in clips)
+    ffmpeg_args = [
+        "ffmpeg", "-y", "-nostdin",
+        "-loglevel", args.ffmpeg_loglevel,
+        *get_thread_args(threads),
+        "-ss", f"{seek:.2f}",
+        "-i", clips[0]["videopath"],
+    ]
+    for clip in clips:
+        offset = round(clip["start"], 2) - seek
+        time = clip["end"] - clip["start"]
+        ffmpeg_args += [
+            "-ss", f"{offset:.2f}",
+            "-t", f"{time:.2f}",
+            "-c:v", "libx264",
+            *get_thread_args(threads),
+            "-f", "mp4",
+            clip["output"],
+        ]
+        if "preview" in clip:
+            ffmpeg_args += [
+                "-ss", f"{offset:.2f}",
+                "-t", f"{time:.2f}",
+                *get_preview_output_args(args.preview_height, clip["preview"], threads),
+            ]
+        if "sprite" in clip:
+            ffmpeg_args += get_thumbnail_output_args(
+                args.thumbnail_width, args.sprite_frames, time, clip["poster"], clip["sprite"], offset
+            )
+
+    run_captured(ffmpeg_args)
+
+    return [get_clip_result(clip) for clip in clips]
+
+
+# Splits the clips of a source video into groups that are each decoded by one ffmpeg process.
+# Clips are grouped in time order so each group only decodes a contiguous stretch of the source
+def get_decode_groups(clips, clips_per_decode):
+    clips = sorted(clips, key=lambda clip: clip["start"])
+    if clips_per_decode <= 0:
+        return [clips]
+    return [clips[i:i + clips_per_decode] for i in range(0, len(clips), clips_per_decode)]
 
 
 def get_uid(args, filename):
@@ -482,126 +546,592 @@ def count_recording(sign, recording, is_valid_exists, recording_count):
     return recording_count
 
 
-# Pool and Pbar are tools to help parallelize, with pool being pool of cpu resources
-# and pbar used to help increment stuff
-def process_file(args, pool, pbar, filename, results, signs, recording_count):
-    pbar.set_description("Processing Timestamps File: %s" % filename)
-    # results = []
-    # signs = set()
-    # recording_count = 0
+# Flattens the parsed description into (sign, file, video_start, sign_start, sign_end, is_valid, attempt)
+# tuples sorted by sign start time
+def sort_recordings(data):
+    newList = []
+    max_attempt = {}
 
-    if filename.endswith("-timestamps.jpg") and not filename.startswith("._"):
-        image = Image.open(os.path.join(args.backup_dir, filename))
-        exifdata = image.getexif()
+    for sign, recording_list in data.items():
 
-        description = get_image_description(exifdata)
+        #If the recording list isn't actually a list, probably just metadata like version number
+        #Recording list contains the {sign, file_path_to_source, video_start time, sign_start, sign_stop, is_valid, attempt_number}
+        if (not isinstance(recording_list, list)):
+            continue
 
-        data, is_valid_exists = get_data_from_description(description, os.path.join(args.dest_dir, "error", f"{filename[:-len('-timestamps.jpg')]}.log"))
+        for recording in recording_list:
+            # Legacy recordings without isValid/attempt already get the defaults from the parser
+            listRecording = (sign, *recording)
+            newList.append(listRecording)
 
-        #File had errors, just skip this file
-        if (data == -1):
-            return
+            if (listRecording[0] in max_attempt):
+                max_attempt[sign] = max(max_attempt[sign], listRecording[6])
+            else:
+                max_attempt[sign] = listRecording[6]
 
-        uid, videopath = get_uid(args, filename)
+    # Sort the data by date
+    return sorted(newList, key=lambda tup: tup[4])
+
+
+# Reads a timestamps file and plans every clip in it, in sign start order
+def plan_file(args, config, filename):
+    uid, videopath = get_uid(args, filename)
+
+    with metrics.timer("exif_read", uid, videopath):
+        description = read_image_description(os.path.join(args.backup_dir, filename))
+
+    with metrics.timer("parse", uid, videopath):
+        data, is_valid_exists = get_data_from_description(description, filename, uid)
+
+    #File had errors, just skip this file
+    if (data == -1):
+        return []
+
+    if len(data) <= 1:  # We want to skip videos that only have 1 sign in them
+        report.add("single_sign_file", file=filename, uid=uid)
+        return []
+
+    if not os.path.exists(videopath):
+        report.add("missing_video", file=filename, uid=uid, videopath=videopath)
+        return []
+
+    with metrics.timer("plan", uid, videopath):
+        return plan_clips(args, config, uid, sort_recordings(data), videopath, duration=get_probed_duration(videopath))
+
+
+# scan: reads and parses one timestamps file without planning any clip or touching ffmpeg. Runs in
+# the pool workers, so problems are returned for the main process to report instead of reported here.
+# Returns a dict with the status of the file and, if plan_file wouldn't skip it, the number of clips
+# failing each pre-flight check and a (sign, recording, is_hold, clip_seconds) tuple per recording
+# whose clip isn't dropped by them, where recording is the parsed (file, video_start, sign_start, sign_end, is_valid, attempt)
+def scan_file(args, config, filename):
+    uid, videopath = get_uid(args, filename)
+    scan = {"file": filename, "uid": uid, "status": "ok", "recordings": []}
+
+    started = time.perf_counter()
+    description = read_image_description(os.path.join(args.backup_dir, filename))
+    scan["exif_read"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    try:
+        data = parse_description(description)
+    except DescriptionParseError as e:
+        scan.update(status="parse_failure", error=e.message, position=e.position, detail=str(e))
+        return scan
+    finally:
+        scan["parse"] = time.perf_counter() - started
+
+    # Same checks as plan_file, the recordings of skipped files aren't counted
+    scan["is_valid_exists"] = "isValid" in description
+    if len(data) <= 1:
+        scan["status"] = "single_sign_file"
+        return scan
+    if not os.path.exists(videopath):
+        scan.update(status="missing_video", videopath=videopath)
+        return scan
+
+    recordings = sort_recordings(data)
+    if recordings:
+        start_subclips, end_subclips, is_hold, checks, dropped = get_checked_recording_ranges(args, config, uid, recordings)
+        scan["checks"] = {check: int(flags.sum()) for check, flags in checks.items() if flags.any()}
+        scan["recordings"] = [
+            (recording[0], recording[1:], bool(is_hold[i]), float(end_subclips[i] - start_subclips[i]))
+            for i, recording in enumerate(recordings)
+            if not dropped[i]
+        ]
+    return scan
+
+
+def new_inventory_counts():
+    return {"recordings": 0, "valid": 0, "invalid": 0, "taps": 0, "holds": 0, "retries": 0, "max_attempt": 0, "clip_seconds": 0.0}
+
+
+# Adds the recordings of a scanned file to the per uid and per uid/sign counts, keyed by the cleaned
+# sign like the clips and the catalog. valid follows count_recording: recordings from recorders
+# without isValid all count as valid
+def add_to_inventory(inventory, scan):
+    uid_inventory = inventory.setdefault(
+        scan["uid"],
+        {"files": 0, "skipped_files": defaultdict(int), "flagged_clips": defaultdict(int), "signs": {}, **new_inventory_counts()},
+    )
+    uid_inventory["files"] += 1
+    if scan["status"] != "ok":
+        uid_inventory["skipped_files"][scan["status"]] += 1
+    for check, count in scan.get("checks", {}).items():
+        uid_inventory["flagged_clips"][check] += count
+
+    recording_count = defaultdict(int)
+    for sign, recording, is_hold, clip_seconds in scan["recordings"]:
+        sign = clean_sign(sign)
+        count_recording(sign, recording, scan["is_valid_exists"], recording_count)
+        attempt = recording[5]
+        for counts in (uid_inventory, uid_inventory["signs"].setdefault(sign, new_inventory_counts())):
+            counts["recordings"] += 1
+            counts["holds" if is_hold else "taps"] += 1
+            counts["retries"] += attempt > 1
+            counts["max_attempt"] = max(counts["max_attempt"], attempt)
+            counts["clip_seconds"] += clip_seconds
+
+    for sign, valid in recording_count.items():
+        uid_inventory["valid"] += valid
+        uid_inventory["signs"][sign]["valid"] += valid
+    for counts in (uid_inventory, *uid_inventory["signs"].values()):
+        counts["invalid"] = counts["recordings"] - counts["valid"]
+
+
+# Duration of a source from --probe, or None without --probe or if ffprobe couldn't tell
+def get_probed_duration(videopath):
+    duration = prober.get(videopath) if prober is not None else None
+    return duration if duration is not None and duration > 0 else None
+
+
+# Duration of a source, from the --probe cache when there is one
+def get_source_duration(videopath):
+    duration = prober.get(videopath) if prober is not None else None
+    return duration if duration is not None else probe_duration(videopath)
+
+
+# Estimated encode cost of every clip plan_file would plan for a timestamps file, in the same order,
+# without creating any directories or logging errors. Files that plan_file skips cost nothing
+def estimate_file_costs(args, config, filename):
+    try:
+        data = parse_description(read_image_description(os.path.join(args.backup_dir, filename)))
+    except DescriptionParseError:
+        return []
+
+    uid, videopath = get_uid(args, filename)
+    recordings = sort_recordings(data)
+    if len(data) <= 1 or not recordings or not os.path.exists(videopath):
+        return []
+
+    # Same clips as plan_clips, including dropping the ones that fail the pre-flight checks
+    start_subclips, end_subclips, _, _, dropped = get_checked_recording_ranges(
+        args, config, uid, recordings, get_probed_duration(videopath)
+    )
+    clip_ranges = [(start, end) for start, end, drop in zip(start_subclips, end_subclips, dropped) if not drop]
+
+    # Sources ffprobe can't read (truncated uploads) cost what their clips do, extraction reports them
+    if args.shard_cost == "probe":
+        try:
+            duration = get_source_duration(videopath)
+        except (subprocess.CalledProcessError, ValueError):
+            duration = None
+        if duration is not None:
+            clip_cost = duration / max(len(clip_ranges), 1) + CLIP_OVERHEAD_COST
+            return [clip_cost] * len(clip_ranges)
+
+    return [get_clip_cost(start, end) for start, end in clip_ranges]
+
+
+def print_shard(args, shard, loads, clip_count):
+    print(
+        f"Shard {args.job_array_num}/{args.num_shards}: {len(shard)} sources, {clip_count} clips, "
+        f"estimated cost {loads[args.job_array_num]:.0f}s "
+        f"(mean {sum(loads) / len(loads):.0f}s, max {max(loads):.0f}s)"
+    )
+
+
+# Works out which timestamps files (and which of their clips) belong to shard --job_array_num.
+# Every array task estimates the cost of every file, so the listing must be the same for all of them
+def get_file_shard(args, filenames):
+    config = load_config()
+    units = {
+        filename: estimate_file_costs(args, config, filename)
+        for filename in sorted(os.fsdecode(file) for file in filenames)
+        if is_timestamps_file(filename)
+    }
+
+    shards, loads = assign_shards(units, args.num_shards)
+    shard = shards[args.job_array_num]
+    print_shard(args, shard, loads, sum(len(indices) for indices in shard.values()))
+    return shard
+
+
+# Same as get_file_shard for the clips of a manifest, with the source videos as the units
+def get_manifest_shard(args, clips):
+    clips_by_source = defaultdict(list)
+    for clip in clips:
+        clips_by_source[clip["videopath"]].append(clip)
+
+    units = {
+        videopath: [get_clip_cost(clip["start"], clip["end"]) for clip in source_clips]
+        for videopath, source_clips in clips_by_source.items()
+    }
+
+    shards, loads = assign_shards(units, args.num_shards)
+    shard = shards[args.job_array_num]
+    shard_clips = [
+        clips_by_source[videopath][i]
+        for videopath, indices in shard.items()
+        for i in indices
+    ]
+    print_shard(args, shard, loads, len(shard_clips))
+    return shard_clips
+
+
+# Producer stage: streams the clips of every timestamps file, one list per file, so extraction
+# can start as soon as the first file is parsed. pbar.total grows as clips are discovered so the
+# bar tracks clips. shard: optional dict of filename -> clip indices from get_file_shard, only
+# those clips are planned
+def iter_file_clips(args, pbar, filenames, shard=None):
+    config = load_config()
+
+    if shard is not None:
+        filenames = list(shard)
+
+    for file in filenames:
+        filename = os.fsdecode(file)
+
+        if not is_timestamps_file(filename):
+            continue
+
+        pbar.set_description("Processing Timestamps File: %s" % filename)
+        clips = plan_file(args, config, filename)
+        if shard is not None:
+            clips = [clips[i] for i in shard[filename]]
+        if clips:
+            metrics.count(clips[0]["videopath"], "planned", len(clips), clips[0]["uid"])
+
+        pbar.total = (pbar.total or 0) + len(clips)
+        pbar.refresh()
+
+        yield clips
+
+
+# Splits the clips of a single source video into jobs, where each job is a list of clips that is
+# handled by a single worker (one clip per job, or one decode group per job with --extract_mode source)
+def get_jobs(args, clips):
+    if args.extract_mode == "source":
+        return get_decode_groups(clips, args.clips_per_decode)
+    return [[clip] for clip in clips]
+
+
+def iter_jobs(args, file_clips):
+    for clips in file_clips:
+        yield from get_jobs(args, clips)
+
+
+# Groups the clips of a manifest by source video so --extract_mode source still works on
+# manifests that were filtered or reordered
+def iter_manifest_jobs(args, clips):
+    clips_by_source = defaultdict(list)
+    for clip in clips:
+        clips_by_source[clip["videopath"]].append(clip)
 
-        noSigns = open(os.path.join(args.dest_dir, "error/noSigns.txt"), "a")
+    for source_clips in clips_by_source.values():
+        # Smart cuts read the keyframes from the probe cache, so they wait for the source's probe
+        if prober is not None and args.cut_mode == "smart":
+            prober.get(source_clips[0]["videopath"])
+        yield from get_jobs(args, source_clips)
 
-        if os.path.exists(videopath) and len(data) > 1:  # We want to skip videos that only have 1 sign in them
-            prevRecording = None
 
-            newList = []
-            max_attempt = {}
+# Previews (--previews) and thumbnails (--thumbnails) written next to a clip, as name -> path
+def get_side_outputs(args, clip):
+    side_outputs = {}
+    if args.previews:
+        side_outputs["preview"] = get_preview_path(args, clip["output"])
+    if args.thumbnails:
+        side_outputs["poster"], side_outputs["sprite"] = get_thumbnail_paths(args, clip["output"])
+    return side_outputs
 
-            for sign, recording_list in data.items():
 
-                #If the recording list isn't actually a list, probably just metadata like version number
-                #Recording list contains the {sign, file_path_to_source, video_start time, sign_start, sign_stop, is_valid, attempt_number}
-                if (not isinstance(recording_list, list)):
+# Clips are written to a partial file first and only renamed once ffmpeg succeeded, so an
+# interrupted run never leaves a truncated clip at the real output path. Previews and thumbnails
+# are written the same way. Partial files a killed run left behind are removed first, so any
+# partial side output found after the cut was written by it
+def run_job(args, clips, threads=None):
+    side_outputs = [get_side_outputs(args, clip) for clip in clips]
+    for clip in clips:
+        remove_partial_outputs(get_partial_outputs(args, clip))
+
+    # Clips from a manifest were planned without creating their directories
+    for path in [clip["output"] for clip in clips] + [path for paths in side_outputs for path in paths.values()]:
+        output_dir = os.path.dirname(path)
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir, exist_ok=True)
+
+    partial_clips = [
+        dict(
+            clip,
+            output=get_partial_path(clip["output"]),
+            **{name: get_partial_path(path) for name, path in paths.items()},
+        )
+        for clip, paths in zip(clips, side_outputs)
+    ]
+    if args.output_format == "npy":
+        for clip in partial_clips:
+            extract_clip_frames(clip, args.video_dim, args.ffmpeg_loglevel, threads)
+        results = [get_clip_result(clip) for clip in clips]
+    elif args.backend == "av":
+        extract_clips_av(partial_clips, threads)
+        results = [get_clip_result(clip) for clip in clips]
+    elif args.extract_mode == "source":
+        results = run_clips_from_source(args, partial_clips, threads)
+    else:
+        probe = get_cached_packets(args, clips[0]["videopath"]) if args.cut_mode == "smart" else None
+        results = [run_clip(args, clip, probe, threads) for clip in partial_clips]
+
+    # Smart cuts, CUDA and the av backend don't write the previews/thumbnails while cutting, so
+    # they are made from the finished clip
+    for clip in partial_clips:
+        if "preview" in clip and not os.path.exists(clip["preview"]):
+            make_preview(clip["output"], args.preview_height, clip["preview"], args.ffmpeg_loglevel, threads)
+        if "sprite" in clip and not os.path.exists(clip["sprite"]):
+            make_thumbnails(
+                clip["output"], args.thumbnail_width, args.sprite_frames, clip["end"] - clip["start"],
+                clip["poster"], clip["sprite"], args.ffmpeg_loglevel, threads,
+            )
+
+    for clip, paths in zip(clips, side_outputs):
+        for path in [clip["output"], *paths.values()]:
+            os.replace(get_partial_path(path), path)
+    return results
+
+
+# Partial outputs run_job writes for a clip
+def get_partial_outputs(args, clip):
+    return [get_partial_path(path) for path in [clip["output"], *get_side_outputs(args, clip).values()]]
+
+
+# run_job with up to --retries retries, --retry_backoff seconds apart and doubling, for failures that
+# aren't persistent (see retry_queue.get_failure). Returns (results, None) or, once the retries are
+# used up, (None, failure) with the number of attempts made
+def run_job_with_retries(args, clips, threads=None, retries=None):
+    retries = args.retries if retries is None else retries
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            return run_job(args, clips, threads), None
+        except Exception as error:
+            failure = get_failure(error)
+        for clip in clips:
+            remove_partial_outputs(get_partial_outputs(args, clip))
+        if failure["persistent"] or attempt > retries:
+            failure["attempts"] = attempt
+            return None, failure
+        time.sleep(get_backoff(args.retry_backoff, attempt))
+
+
+# Runs a job without letting one bad clip fail the others: a decode group (--extract_mode source)
+# that fails is split up and every clip of it is run (and retried) on its own. Returns the
+# results of the clips that finished as index -> result and (index, failure) of the others
+def run_isolated_job(args, clips, threads=None):
+    if len(clips) > 1:
+        results, _ = run_job_with_retries(args, clips, threads, retries=0)
+        if results is not None:
+            return dict(enumerate(results)), []
+
+    finished, failures = {}, []
+    for i, clip in enumerate(clips):
+        results, failure = run_job_with_retries(args, [clip], threads)
+        if results is not None:
+            finished[i] = results[0]
+        else:
+            failures.append((i, failure))
+    return finished, failures
+
+
+# CPU seconds used so far by this worker and the ffmpeg processes it ran (--backend av encodes
+# inside the worker itself)
+def get_cpu_time():
+    cpu_time = 0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        usage = resource.getrusage(who)
+        cpu_time += usage.ru_utime + usage.ru_stime
+    return cpu_time
+
+
+# run_isolated_job that also returns the wall clock and CPU time of the job and the size of every
+# clip it wrote, for the metrics report and so --scheduler adaptive can measure each -threads setting
+def run_timed_job(args, clips, threads=None):
+    started = time.monotonic()
+    cpu_started = get_cpu_time()
+    finished, failures = run_isolated_job(args, clips, threads)
+    elapsed = time.monotonic() - started
+    cpu_time = get_cpu_time() - cpu_started
+
+    output_bytes = [os.path.getsize(clips[i]["output"]) for i in finished]
+    return finished, failures, elapsed, cpu_time, output_bytes
+
+
+def get_job_seconds(clips):
+    return sum(clip["end"] - clip["start"] for clip in clips)
+
+
+def make_scheduler(args):
+    if args.scheduler == "adaptive":
+        return AdaptiveScheduler(args.cpu_budget, args.log_file)
+    return None
+
+
+def make_dedup(args):
+    if args.dedup_cache is not None:
+        return DedupCache(args.dedup_cache)
+    return None
+
+
+# With --scheduler adaptive the pool needs enough workers for the scheduler's largest budget, the
+# scheduler decides how many of them actually run ffmpeg at once
+def get_pool_size(args, scheduler):
+    return scheduler.max_processes if scheduler is not None else args.num_threads
+
+
+# Every worker opens its read-only --probe cache once, see init_worker
+def make_pool(args, scheduler):
+    return Pool(get_pool_size(args, scheduler), initializer=init_worker, initargs=(args,))
+
+
+# --queue_size, 4 jobs per worker by default so every worker of the pool (the adaptive scheduler's
+# included) has its next jobs waiting
+def get_queue_size(args, scheduler):
+    return args.queue_size if args.queue_size is not None else 4 * get_pool_size(args, scheduler)
+
+
+# Clips from a run without --previews/--thumbnails are extracted again to get them
+def is_clip_done(args, ledger, key, clip):
+    if not all(os.path.exists(path) for path in get_side_outputs(args, clip).values()):
+        return False
+    return ledger.is_done(key, clip)
+
+
+# Links the clip (and its previews/thumbnails) of an identical clip from any earlier run that used
+# the same --dedup_cache instead of extracting it again. Returns False if there is none
+def reuse_clip(args, dedup, clip):
+    side_outputs = get_side_outputs(args, clip)
+    cached = dedup.find(args, clip, side_outputs)
+    if cached is None:
+        return False
+
+    cached_output, cached_side_outputs = cached
+    links = [(cached_output, clip["output"])] + [(cached_side_outputs[name], path) for name, path in side_outputs.items()]
+    for source, target in links:
+        if os.path.abspath(source) == os.path.abspath(target):
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        link_output(source, target)
+    dedup.mark_reused(args, clip)
+    return True
+
+
+# Drains the jobs from every timestamps file through one shared pool. At most --queue_size
+# jobs are queued/running at once so the producer never gets too far ahead of the workers.
+# Clips the ledger already has are skipped and every finished clip is recorded in it. Clips that
+# fail are retried in the worker (see run_isolated_job) and the ones that keep failing are reported
+# and written to --retry_queue while the other jobs keep going.
+# scheduler: optional AdaptiveScheduler that picks -threads per job and holds jobs back until
+# the cores they need are free. dedup: optional DedupCache of clips from earlier runs.
+# catalog: optional ClipCatalog finished clips are added to as they land
+def run_jobs(args, pool, pbar, jobs, ledger, scheduler=None, dedup=None, catalog=None):
+    queue_slots = threading.BoundedSemaphore(get_queue_size(args, scheduler))
+
+    def finish_clips(results, keys, clips):
+        for (isValid, fileName, signName), clip in zip(results, clips):
+            if not isValid:
+                report.add("invalid_recording", file=fileName, sign=signName, uid=clip["uid"], output=clip["output"])
+        if args.thumbnails:
+            append_index_entries(
+                os.path.join(args.thumbnail_dir, THUMBNAIL_INDEX_FILENAME),
+                [get_index_entry(args, clip["output"], clip["end"] - clip["start"]) for clip in clips],
+            )
+        if args.output_format == "npy":
+            append_index_entries(
+                os.path.join(args.dest_dir, FRAMES_INDEX_FILENAME),
+                [get_frames_index_entry(args, clip) for clip in clips],
+            )
+        ledger.mark_done(keys, clips)
+        if catalog is not None:
+            catalog.add(clips)
+        pbar.update(len(results))
+
+    def fail_clips(clips, failures):
+        for clip, failure in zip(clips, failures):
+            report.add(
+                "ffmpeg_failure", uid=clip["uid"], sign=clip["sign"], videopath=clip["videopath"], output=clip["output"],
+                attempts=failure["attempts"], error=failure["error"], stderr=failure["stderr"],
+            )
+            metrics.count(clip["videopath"], "failed", 1, clip["uid"])
+        write_retry_queue(args.retry_queue, clips, failures)
+        pbar.update(len(clips))
+
+    def on_done(job_result, keys, clips, ticket=None):
+        finished, failures, elapsed, cpu_time, output_bytes = job_result
+        if ticket is not None:
+            scheduler.release(ticket, elapsed, cpu_time, len(clips))
+
+        uid, videopath = clips[0]["uid"], clips[0]["videopath"]
+        metrics.record("extract_wall", elapsed, uid, videopath)
+        metrics.record("extract_cpu", cpu_time, uid, videopath)
+        for size in output_bytes:
+            metrics.record("output_bytes", size, uid, videopath)
+
+        if failures:
+            fail_clips([clips[i] for i, _ in failures], [failure for _, failure in failures])
+        if finished:
+            finished_clips = [clips[i] for i in finished]
+            metrics.count(videopath, "clips", len(finished_clips), uid)
+            if dedup is not None:
+                dedup.add(args, finished_clips, [get_side_outputs(args, clip) for clip in finished_clips])
+            finish_clips(list(finished.values()), [keys[i] for i in finished], finished_clips)
+        queue_slots.release()
+
+    # Only for errors outside of the clips' extraction (e.g. a worker that died), the clips of the
+    # job go to the retry queue like any failed clip
+    def on_error(error, clips, ticket=None):
+        if ticket is not None:
+            scheduler.release(ticket)
+        failure = dict(get_failure(error), attempts=1)
+        fail_clips(clips, [failure] * len(clips))
+        queue_slots.release()
+
+    for job in jobs:
+        keys = [get_clip_key(args, clip) for clip in job]
+        if not args.restart:
+            remaining = [(key, clip) for key, clip in zip(keys, job) if not is_clip_done(args, ledger, key, clip)]
+            pbar.update(len(job) - len(remaining))
+            if len(remaining) < len(job):
+                metrics.count(job[0]["videopath"], "already_done", len(job) - len(remaining), job[0]["uid"])
+                if catalog is not None:
+                    remaining_keys = {key for key, _ in remaining}
+                    catalog.add([clip for key, clip in zip(keys, job) if key not in remaining_keys], replace=False)
+            if not remaining:
+                continue
+            keys, job = [key for key, _ in remaining], [clip for _, clip in remaining]
+
+        if dedup is not None and not args.restart:
+            reused = [reuse_clip(args, dedup, clip) for clip in job]
+            if any(reused):
+                reused_keys = [key for key, is_reused in zip(keys, reused) if is_reused]
+                reused_clips = [clip for clip, is_reused in zip(job, reused) if is_reused]
+                metrics.count(job[0]["videopath"], "deduplicated", len(reused_clips), job[0]["uid"])
+                finish_clips([get_clip_result(clip) for clip in reused_clips], reused_keys, reused_clips)
+                keys = [key for key, is_reused in zip(keys, reused) if not is_reused]
+                job = [clip for clip, is_reused in zip(job, reused) if not is_reused]
+                if not job:
                     continue
 
-                for recording in recording_list:
-                    listRecording = list(recording) #May be a dictionary or set?
-                    listRecording.insert(0, sign)
-
-                    #If we have 6 attributes, it is probably a recording made by the legacy
-                    #Recorder when there weren't attempt numbers, so we set the max attempt to be 1
-                    if (len(listRecording) == 6):
-                        listRecording.append(0)
-
-                    listRecording = tuple(listRecording)
-                    newList.append(listRecording)
-
-
-                    if (listRecording[0] in max_attempt):
-                        max_attempt[sign] = max(max_attempt[sign], listRecording[6])
-                    else:
-                        #print(f"TEST")
-                        #print(f"ListRecording: {listRecording}")
-                        max_attempt[sign] = listRecording[6]
-
-            # Sort the data by date
-            sortedData = sorted(newList, key=lambda tup: tup[4])
-            reject_list = [(x[6] < max_attempt[x[0]]) for x in sortedData]
-            
-
-            #Add the pool.map once done (And this comment)
-            results = pool.map(
-                lambda i: extract_clip_from_video(
-                    args,
-                    uid,
-                    sortedData[i][0],
-                    sortedData[i][6], # 6th element is the nth attempt attribute (recording_idx)
-                    sortedData[i],
-                    sortedData[i - 1] if i > 0 else None,
-                    videopath,
-                    is_valid_exists
-                    #reject_list[i]
-                ),
-                range(len(sortedData))
+        queue_slots.acquire()
+        if scheduler is None:
+            pool.apply_async(
+                run_timed_job,
+                (args, job),
+                callback=lambda job_result, keys=keys, job=job: on_done(job_result, keys, job),
+                error_callback=lambda error, job=job: on_error(error, job),
             )
-            
-
-            errorSignsFile = open(os.path.join(args.dest_dir, "error/errorSigns.txt"), "a")
-            for isValid, fileName, signName in results:
-                if not isValid:
-                    errorSignsFile.write(fileName + ', ' + signName + '\n')
-            errorSignsFile.close()
-
-
-        elif len(data) <= 1:
-            noSigns.write(filename + "\n")
-            noSigns.close()
-
-
-"""             for sign, recording_list in sortedData:
-                signs.add(clean_sign(sign))
-                print("Recording List: ", recording_list)
-                for idx, recording in enumerate(recording_list):
-                    count_recording(sign, recording, is_valid_exists, recording_count)
-                    if not args.skip_extraction:
-                        thread_args = (
-                            args,
-                            uid,
-                            sign,
-                            idx,
-                            recording,
-		                    prevRecording,
-                            videopath,
-                            is_valid_exists,
-                        )
-                        result = extract_clip_from_video(args,
-                            uid,
-                            sign,
-                            idx,
-                            recording,
-		                    prevRecording,
-                            videopath,
-                            is_valid_exists,)
-                        results.append(result)
-                    prevRecording = recording_list[0] """
-
-
-# return results, signs, recording_count
+            continue
+
+        ticket = scheduler.acquire(get_job_seconds(job))
+        pool.apply_async(
+            run_timed_job,
+            (args, job, ticket.threads),
+            callback=lambda job_result, keys=keys, job=job, ticket=ticket: on_done(job_result, keys, job, ticket),
+            error_callback=lambda error, job=job, ticket=ticket: on_error(error, job, ticket),
+        )
+
+    pool.close()
+    pool.join()
+    if scheduler is not None:
+        scheduler.close()
 
 
 def make_missing_dirs(args):
@@ -614,10 +1144,230 @@ def make_missing_dirs(args):
     if not os.path.exists(os.path.join(args.dest_dir, "invalid")):
         os.makedirs(os.path.join(args.dest_dir, "invalid"))
 
+    if not os.path.exists(os.path.join(args.dest_dir, "logs")):
+        os.makedirs(os.path.join(args.dest_dir, "logs"))
+
     if not os.path.exists("logs"):
         os.mkdir("logs")
 
 
+# The timestamps files of --backup_dir, from a batch file with --job_array_num or streamed from the
+# directory (see backup_listing.iter_timestamp_files). missing: optional list the streamed
+# timestamps files without a video are appended to
+def get_timestamp_filenames(args, missing=None):
+    if args.job_array_num is not None and args.num_shards is None:
+        with open(
+                f"/data/sign_language_videos/batches/batch_{args.job_array_num}.txt"
+        ) as fin:
+            return fin.read().splitlines()
+    return iter_timestamp_files(args.backup_dir, args.recursive, missing)
+
+
+# Streams get_timestamp_filenames, recording the time spent listing as the scan stage. Timestamps
+# files without a video are only known once their directory is listed and are reported then
+# missing: optional list they are also appended to
+def iter_timestamp_filenames(args, missing=None):
+    missing = [] if missing is None else missing
+    started = time.perf_counter()
+    filenames = iter(get_timestamp_filenames(args, missing))
+    elapsed = time.perf_counter() - started
+    while True:
+        started = time.perf_counter()
+        filename = next(filenames, None)
+        elapsed += time.perf_counter() - started
+        if filename is None:
+            break
+        yield filename
+    metrics.record("scan", elapsed)
+
+    for filename in missing:
+        uid, videopath = get_uid(args, filename)
+        report.add("missing_video", file=filename, uid=uid, videopath=videopath)
+
+
+# Submits the probe of every source once its timestamps file is listed and hands the files on
+# PROBE_AHEAD files later, so the probes run ahead of planning without listing everything first
+def iter_probed_filenames(args, filenames):
+    ahead = deque()
+    for filename in filenames:
+        if is_timestamps_file(filename):
+            prober.submit(get_uid(args, filename)[1])
+        ahead.append(filename)
+        if len(ahead) > PROBE_AHEAD:
+            yield ahead.popleft()
+    yield from ahead
+
+
+# Writes the per stage timings of the run to --metrics_file, and to a Prometheus textfile in logs/
+# with --prometheus
+def write_metrics(args):
+    metrics.write_json(args.metrics_file)
+    if args.prometheus:
+        metrics.write_prometheus(os.path.join("logs", "decode_split_by_length.prom"))
+
+
+# Every --backup_dir (or uid directory of --wave_root) as its own copy of args, so planning only
+# ever sees one backup_dir. Sharding splits every source over the shards, so each array task gets
+# its share of every user. With --probe every source video is queued for probing right away
+def get_sources(args):
+    sources = []
+    for backup_dir in args.backup_dirs:
+        source_args = argparse.Namespace(**dict(vars(args), backup_dir=backup_dir))
+        filenames = iter_timestamp_filenames(source_args)
+        if prober is not None:
+            filenames = iter_probed_filenames(source_args, filenames)
+        # Every array task needs the whole listing to agree on the shards
+        shard = get_file_shard(source_args, list(filenames)) if args.num_shards is not None else None
+        sources.append((source_args, filenames, shard))
+    return sources
+
+
+def iter_source_clips(pbar, sources):
+    for source_args, filenames, shard in sources:
+        for clips in iter_file_clips(source_args, pbar, filenames, shard):
+            yield from clips
+
+
+def iter_source_jobs(pbar, sources):
+    for source_args, filenames, shard in sources:
+        yield from iter_jobs(source_args, iter_file_clips(source_args, pbar, filenames, shard))
+
+
+# Writes dest_dir/logs/(uid).log for every uid of the run: what was planned and extracted for it
+# and the problems the report recorded for it. Array tasks (--job_array_num) write
+# (uid)-(job_array_num).log instead, the tasks share dest_dir and usually have the same uids
+def write_user_logs(args):
+    summary = metrics.summary()
+    problems = report.summary()["uids"]
+    log_dir = os.path.join(args.dest_dir, "logs")
+    suffix = f"-{args.job_array_num}" if args.job_array_num is not None else ""
+    for uid in sorted(set(summary["uid_counts"]) | set(problems)):
+        counts = summary["uid_counts"].get(uid, {})
+        stages = summary["uids"].get(uid, {})
+        with open(os.path.join(log_dir, f"{uid}{suffix}.log"), "w") as f:
+            f.write(f"uid: {uid}\n")
+            f.write(f"run started: {summary['started']}\n")
+            f.write(f"clips planned: {counts.get('planned', 0)}\n")
+            f.write(f"clips extracted: {counts.get('clips', 0)}\n")
+            f.write(f"clips already done: {counts.get('already_done', 0)}\n")
+            if args.dedup_cache is not None:
+                f.write(f"clips deduplicated: {counts.get('deduplicated', 0)}\n")
+            f.write(f"clips failed: {counts.get('failed', 0)}\n")
+            for stage in ("extract_wall", "extract_cpu"):
+                if stage in stages:
+                    f.write(f"{stage} seconds: {stages[stage]['sum']:.1f}\n")
+            for reason, count in problems.get(uid, {}).items():
+                f.write(f"{reason}: {count}\n")
+
+
+# scan (or run --skip_extraction): parses every timestamps file of every backup dir in the worker
+# pool and writes a per uid/sign inventory of the recordings to dest_dir/inventory.json, without
+# planning or extracting anything. Quick enough to size array jobs and catch broken recorder
+# metadata before starting the encode
+def scan(args):
+    config = load_config()
+    pool = Pool(args.num_threads)
+    inventory = {}
+    file_count = 0
+
+    for backup_dir in args.backup_dirs:
+        source_args = argparse.Namespace(**dict(vars(args), backup_dir=backup_dir))
+        missing = []
+        filenames = filter(is_timestamps_file, iter_timestamp_filenames(source_args, missing))
+        scans = pool.imap_unordered(functools.partial(scan_file, source_args, config), filenames, chunksize=16)
+
+        for scan in tqdm(scans, unit="file", desc=backup_dir):
+            file_count += 1
+            metrics.record("exif_read", scan["exif_read"], scan["uid"])
+            metrics.record("parse", scan["parse"], scan["uid"])
+            if scan["status"] == "parse_failure":
+                report.add("parse_failure", file=scan["file"], uid=scan["uid"], error=scan["error"], position=scan["position"], detail=scan["detail"])
+            elif scan["status"] == "single_sign_file":
+                report.add("single_sign_file", file=scan["file"], uid=scan["uid"])
+            elif scan["status"] == "missing_video":
+                report.add("missing_video", file=scan["file"], uid=scan["uid"], videopath=scan["videopath"])
+            add_to_inventory(inventory, scan)
+
+        # Reported by iter_timestamp_filenames, only counted here
+        for filename in missing:
+            file_count += 1
+            add_to_inventory(inventory, {"uid": get_uid(source_args, filename)[0], "status": "missing_video", "recordings": []})
+
+    pool.close()
+    pool.join()
+
+    inventory_path = os.path.join(args.dest_dir, "inventory.json")
+    with open(inventory_path, "w") as f:
+        json.dump({"files": file_count, "uids": inventory}, f, indent=2)
+    write_metrics(args)
+
+    for uid, counts in sorted(inventory.items()):
+        print(
+            f"{uid}: {counts['files']} files, {counts['recordings']} recordings "
+            f"({counts['valid']} valid, {counts['holds']} holds, {counts['retries']} retries), "
+            f"{counts['clip_seconds']:.0f}s of clips"
+        )
+    print(f"Wrote the inventory of {file_count} files to {inventory_path}")
+
+
+# plan: scan --backup_dir and write every clip to the manifest without running ffmpeg
+def plan(args):
+    sources = get_sources(args)
+    pbar = tqdm(total=0, unit="clip")
+    clip_count = write_manifest(args.manifest, iter_source_clips(pbar, sources))
+    pbar.close()
+    write_metrics(args)
+    print(f"Wrote {clip_count} clips to {args.manifest}")
+
+
+# execute: extract the clips of a manifest written by plan
+def execute(args):
+    # The workers are forked before the probe threads start any ffprobe, a worker forked while a
+    # thread spawns a subprocess holds on to that subprocess' pipes and the thread never returns
+    scheduler = make_scheduler(args)
+    pool = make_pool(args, scheduler) # Used for Multiprocessing
+    clips = list(read_manifest(args.manifest))
+    if prober is not None:
+        for videopath in dict.fromkeys(clip["videopath"] for clip in clips):
+            prober.submit(videopath)
+    if args.num_shards is not None:
+        clips = get_manifest_shard(args, clips)
+    pbar = tqdm(total=len(clips), unit="clip")
+    ledger = CompletionLedger(args.ledger)
+    dedup = make_dedup(args)
+    catalog = ClipCatalog(args.catalog, args.dest_dir, args.batch)
+    run_jobs(args, pool, pbar, iter_manifest_jobs(args, clips), ledger, scheduler, dedup, catalog)
+    ledger.close()
+    catalog.close()
+    if dedup is not None:
+        dedup.close()
+    pbar.close()
+    write_metrics(args)
+    write_user_logs(args)
+
+
+# run: plan and extract in one go, extraction starts as soon as the first file is planned. The
+# clips of every backup dir go through the same pool, so the workers never wait for a user to finish
+def run(args):
+    # Forked before get_sources starts the probes, see execute
+    scheduler = make_scheduler(args)
+    pool = make_pool(args, scheduler) # Used for Multiprocessing
+    sources = get_sources(args)
+    pbar = tqdm(total=0, unit="clip")
+
+    ledger = CompletionLedger(args.ledger)
+    dedup = make_dedup(args)
+    catalog = ClipCatalog(args.catalog, args.dest_dir, args.batch)
+    run_jobs(args, pool, pbar, iter_source_jobs(pbar, sources), ledger, scheduler, dedup, catalog)
+    ledger.close()
+    catalog.close()
+    if dedup is not None:
+        dedup.close()
+    pbar.close()
+    write_metrics(args)
+    write_user_logs(args)
+
+
 if __name__ == "__main__":
     args = parse_args()
     #print("Args: ", args)
@@ -628,35 +1378,40 @@ if __name__ == "__main__":
             "logs", "decode_" + datetime.datetime.now().strftime("%Y-%m-%d_%H-%M")
         )
 
-    if args.job_array_num is not None:
-        backup_dir = os.fsencode(args.backup_dir)
-        with open(
-                f"/data/sign_language_videos/batches/batch_{args.job_array_num}.txt"
-        ) as fin:
-            assigned_videos = fin.read().splitlines()
+    if args.metrics_file is None:
+        args.metrics_file = args.log_file + "_metrics.json"
 
-        pbar = tqdm(assigned_videos)
-        pool = Pool(args.num_threads)
+    if args.manifest is None:
+        args.manifest = os.path.join(args.dest_dir, "manifest.jsonl")
 
-    else:
-        backup_dir = os.fsencode(args.backup_dir)
-        pbar = tqdm(os.listdir(backup_dir))
-        pool = Pool(args.num_threads) # Used for Multiprocessing
+    if args.ledger is None:
+        args.ledger = os.path.join(args.dest_dir, "ledger.sqlite")
 
-    results = []
-    signs = set()
-    recording_count = defaultdict(int)
+    if args.probe_cache is None:
+        args.probe_cache = os.path.join(args.dest_dir, "probe_cache.sqlite")
 
-    for file in pbar:
-        #print(file)
-        filename = os.fsdecode(file)
+    if args.catalog is None:
+        args.catalog = os.path.join(args.dest_dir, "catalog.sqlite")
 
-        if filename.endswith(".zip"):
-            continue
+    if args.batch is None:
+        args.batch = os.path.basename(os.path.normpath(args.dest_dir))
 
-        process_file(args, pool, pbar, filename, results, signs, recording_count)
+    if args.retry_queue is None:
+        args.retry_queue = os.path.join(args.dest_dir, "retry_queue.jsonl")
 
-    pool.close()
-    #print("Signs: ", signs)
-    #print("Recording Count (Total): ", sum(recording_count.values()))
-    #print("Recording Count (by Sign): ", recording_count)
+    if args.preview_dir is None:
+        args.preview_dir = os.path.normpath(args.dest_dir) + "_preview"
+
+    if args.thumbnail_dir is None:
+        args.thumbnail_dir = os.path.normpath(args.dest_dir) + "_thumbnails"
+
+    report.open(os.path.join(args.dest_dir, "error", "report.jsonl"))
+    if args.probe:
+        prober = SourceProber(args.probe_cache, args.probe_threads, metrics)
+    commands = {"run": run, "plan": plan, "execute": execute, "scan": scan}
+    try:
+        commands[args.command](args)
+    finally:
+        if prober is not None:
+            prober.close()
+        report.close()
@@ -0,0 +1,182 @@
+import datetime
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+from decode_ledger import connect_database, get_partial_path
+
+# The fingerprint of a source is its size and the hash of SAMPLE_COUNT evenly spaced SAMPLE_SIZE
+# chunks, so fingerprinting a multi GB session only reads a few MB
+SAMPLE_SIZE = 1 << 20
+SAMPLE_COUNT = 4
+
+
+def get_fingerprint(videopath):
+    size = os.path.getsize(videopath)
+    digest = hashlib.sha1(str(size).encode())
+    with open(videopath, "rb") as f:
+        if size <= SAMPLE_SIZE * SAMPLE_COUNT:
+            digest.update(f.read())
+        else:
+            for i in range(SAMPLE_COUNT):
+                f.seek((size - SAMPLE_SIZE) * i // (SAMPLE_COUNT - 1))
+                digest.update(f.read(SAMPLE_SIZE))
+    return digest.hexdigest()
+
+
+# Parameters of every side output (see decode_split_by_length.get_side_outputs) an earlier side
+# output has to match to be reused
+def get_side_output_params(args):
+    return {
+        "preview": [args.preview_height],
+        "poster": [args.thumbnail_width],
+        "sprite": [args.thumbnail_width, args.sprite_frames],
+    }
+
+
+# Hardlinks source to target (through a partial file, so an existing target is replaced atomically),
+# or copies it when they are on different filesystems
+def link_output(source, target):
+    partial = get_partial_path(target)
+    if os.path.exists(partial):
+        os.remove(partial)
+    try:
+        os.link(source, partial)
+    except OSError:
+        shutil.copy2(source, partial)
+    os.replace(partial, target)
+
+
+# SQLite cache of every clip extracted with --dedup_cache, keyed by the content of its source instead
+# of its path, so a session that shows up again in another backup dir or wave (re-uploads, copied
+# wave folders) reuses the clips of the first copy instead of re-encoding them. The timestamps of
+# the session only matter through the clip ranges they give, which are part of the key. Unlike the
+# ledger the cache can be shared by any number of dest_dirs
+class DedupCache:
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.connection = connect_database(path)
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS sources (
+                videopath TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                fingerprint TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS sources_fingerprint ON sources (fingerprint);
+            CREATE TABLE IF NOT EXISTS clips (
+                key TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                start REAL NOT NULL,
+                end REAL NOT NULL,
+                output TEXT NOT NULL,
+                side_outputs TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                reuses INTEGER NOT NULL DEFAULT 0
+            );
+            """
+        )
+        self.connection.commit()
+
+    # Sources are only hashed again when their size or mtime changed
+    def get_source_fingerprint(self, videopath):
+        videopath = os.path.abspath(videopath)
+        stat = os.stat(videopath)
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT fingerprint FROM sources WHERE videopath = ? AND size = ? AND mtime_ns = ?",
+                (videopath, stat.st_size, stat.st_mtime_ns),
+            ).fetchone()
+        if row is not None:
+            return row[0]
+
+        fingerprint = get_fingerprint(videopath)
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO sources (videopath, size, mtime_ns, fingerprint) VALUES (?, ?, ?, ?)",
+                (videopath, stat.st_size, stat.st_mtime_ns, fingerprint),
+            )
+            self.connection.commit()
+        return fingerprint
+
+    # Same parameters as decode_ledger.get_clip_key, with the source's fingerprint instead of its
+    # path and without the output path
+    def get_clip_key(self, args, clip):
+        params = [
+            self.get_source_fingerprint(clip["videopath"]),
+            clip["start"],
+            clip["end"],
+            args.cut_mode,
+            args.use_cuda,
+            list(args.video_dim) if args.use_cuda or args.output_format == "npy" else None,
+        ]
+        return hashlib.sha1(json.dumps(params).encode()).hexdigest()
+
+    # Returns the output of an earlier identical clip and its side outputs (name -> path) for every
+    # name in side_outputs, or None if there is no such clip or one of its files is gone
+    def find(self, args, clip, side_outputs):
+        key = self.get_clip_key(args, clip)
+        with self.lock:
+            row = self.connection.execute("SELECT output, side_outputs FROM clips WHERE key = ?", (key,)).fetchone()
+        if row is None or not os.path.exists(row[0]):
+            return None
+
+        output, cached_side_outputs = row[0], json.loads(row[1])
+        params = get_side_output_params(args)
+        found = {}
+        for name in side_outputs:
+            if name not in cached_side_outputs:
+                return None
+            path, cached_params = cached_side_outputs[name]
+            if cached_params != params[name] or not os.path.exists(path):
+                return None
+            found[name] = path
+        return output, found
+
+    def add(self, args, clips, side_outputs):
+        created_at = datetime.datetime.now().isoformat(timespec="seconds")
+        params = get_side_output_params(args)
+        rows = []
+        for clip, paths in zip(clips, side_outputs):
+            key = self.get_clip_key(args, clip)
+            fingerprint = self.get_source_fingerprint(clip["videopath"])
+            side_output_rows = {name: [os.path.abspath(path), params[name]] for name, path in paths.items()}
+            rows.append((key, fingerprint, clip["start"], clip["end"], os.path.abspath(clip["output"]), json.dumps(side_output_rows), created_at))
+
+        with self.lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO clips (key, fingerprint, start, end, output, side_outputs, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self.connection.commit()
+
+    def mark_reused(self, args, clip):
+        key = self.get_clip_key(args, clip)
+        with self.lock:
+            self.connection.execute("UPDATE clips SET reuses = reuses + 1 WHERE key = ?", (key,))
+            self.connection.commit()
+
+    def stats(self):
+        with self.lock:
+            sources, fingerprints = self.connection.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT fingerprint) FROM sources"
+            ).fetchone()
+            clips, reuses = self.connection.execute("SELECT COUNT(*), COALESCE(SUM(reuses), 0) FROM clips").fetchone()
+            duplicated = self.connection.execute(
+                "SELECT fingerprint, COUNT(*) FROM sources GROUP BY fingerprint HAVING COUNT(*) > 1 ORDER BY COUNT(*) DESC"
+            ).fetchall()
+
+        return {
+            "sources": sources,
+            "unique_sources": fingerprints,
+            "duplicated_sources": {fingerprint: count for fingerprint, count in duplicated},
+            "clips": clips,
+            "reused_clips": reuses,
+        }
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
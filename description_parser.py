@@ -0,0 +1,242 @@
+import re
+from collections import namedtuple
+from json.decoder import scanstring
+
+# One sign recording from the recorder's timestamps description. Timestamps are kept as the
+# recorder's "%Y_%m_%d_%H_%M_%S.mmm" strings since they are used as-is in the clip filenames.
+# Legacy recorders didn't write isValid/attempt, so those default to True/0
+Recording = namedtuple(
+    "Recording", ["file", "video_start", "sign_start", "sign_end", "is_valid", "attempt"]
+)
+
+FIELD_NAMES = {
+    "file": "file",
+    "videoStart": "video_start",
+    "signStart": "sign_start",
+    "signEnd": "sign_end",
+    "isValid": "is_valid",
+    "attempt": "attempt",
+}
+REQUIRED_FIELDS = ("file", "video_start", "sign_start", "sign_end")
+BOOLEANS = {"True": True, "true": True, "False": False, "false": False}
+
+WHITESPACE = re.compile(r"\s*")
+# name=value inside a recording, value runs up to the next , ) ] or the end of the JSON string
+FIELD = re.compile(r'\s*(\w+)=((?:[^,)\]"\\]|\\.)*)')
+SCALAR = re.compile(r'[^,}\s]+')
+# A whole well-formed recording in the field order every recorder version writes. Anything else
+# (unknown fields, unclosed legacy recordings) goes through the field by field path, which
+# is slower but handles everything and reports where the problem is
+RECORDING = re.compile(
+    r'\(\s*file=([^,)\]"]*),\s*videoStart=([^,)\]"]*),\s*signStart=([^,)\]"]*),\s*signEnd=([^,)\]"]*)'
+    r'(?:,\s*isValid=(True|true|False|false))?(?:,\s*attempt=(\d+))?\s*(?:,\s*)?\)?'
+)
+
+
+# Field values are still JSON escaped since they sit inside the JSON string of the sign
+def unescape_value(value):
+    if "\\" in value:
+        value = value.replace("\\/", "/").replace("\\r", "")
+    return value.strip()
+
+
+class DescriptionParseError(ValueError):
+    def __init__(self, message, description, position):
+        self.message = message
+        self.position = position
+
+        start = max(position - 30, 0)
+        context = description[start:position + 30].replace("\n", " ").replace("\r", " ")
+        pointer = " " * (position - start) + "^"
+        super().__init__(f"{message} at position {position}:\n{context}\n{pointer}")
+
+
+# Sign name as it appears in the clip paths (the sign directories and filenames), what the
+# annotation tools key on
+def clean_sign(sign):
+    sign = sign.replace(" / ", "")
+    sign = sign.replace(" ", "")
+    sign = sign.replace("-", "")
+    sign = sign.replace(",", "")
+    sign = sign.replace("(", "")
+    sign = sign.replace(")", "")
+    sign = sign.replace("'", "") # Maybe replacing single quotes won't break everything?
+    return sign
+
+
+# Parses the ImageDescription written by the recorder, e.g.
+#   {"apple": "[(file=\/sdcard\/x.mp4, videoStart=..., signStart=..., signEnd=..., isValid=True, attempt=1)]", ...}
+# in a single pass. Returns a dict of sign -> list of Recording, other values (e.g. the recorder
+# version) are kept as strings. Raises DescriptionParseError with the position of the problem.
+def parse_description(description):
+    return DescriptionParser(description).parse()
+
+
+class DescriptionParser:
+    def __init__(self, description):
+        self.text = description
+        self.pos = 0
+
+    def error(self, message, position=None):
+        return DescriptionParseError(message, self.text, self.pos if position is None else position)
+
+    def skip_whitespace(self):
+        self.pos = WHITESPACE.match(self.text, self.pos).end()
+
+    def peek(self):
+        return self.text[self.pos] if self.pos < len(self.text) else ""
+
+    def expect(self, char):
+        if self.peek() != char:
+            found = repr(self.peek()) if self.peek() else "end of description"
+            raise self.error(f"Expected {char!r} but found {found}")
+        self.pos += 1
+
+    def parse(self):
+        data = {}
+
+        self.skip_whitespace()
+        self.expect("{")
+        self.skip_whitespace()
+        if self.peek() == "}":
+            self.pos += 1
+        else:
+            while True:
+                self.skip_whitespace()
+                key = self.parse_string()
+                # The recorder sometimes ends phrases with a period, which isn't part of the sign
+                if key.endswith("."):
+                    key = key[:-1]
+
+                self.skip_whitespace()
+                self.expect(":")
+                self.skip_whitespace()
+                data[key] = self.parse_value()
+
+                self.skip_whitespace()
+                if self.peek() == ",":
+                    self.pos += 1
+                    continue
+                self.expect("}")
+                break
+
+        self.skip_whitespace()
+        if self.pos != len(self.text):
+            raise self.error("Unexpected text after the end of the description")
+        return data
+
+    def parse_string(self):
+        if self.peek() != '"':
+            raise self.error("Expected a quoted string")
+        try:
+            value, self.pos = scanstring(self.text, self.pos + 1)
+        except ValueError as e:
+            raise self.error(f"Invalid string ({e.msg})", e.pos)
+        return value
+
+    def parse_value(self):
+        if self.peek() != '"':
+            match = SCALAR.match(self.text, self.pos)
+            if match is None:
+                raise self.error("Expected a value")
+            self.pos = match.end()
+            return match.group()
+
+        list_start = WHITESPACE.match(self.text, self.pos + 1).end()
+        if self.text.startswith("[", list_start):
+            self.pos = list_start + 1
+            return self.parse_recording_list()
+        return self.parse_string()
+
+    # Parses the recordings inside "[...]", consuming the closing quote
+    def parse_recording_list(self):
+        recordings = []
+        while True:
+            self.skip_whitespace()
+            char = self.peek()
+            if char == ",":
+                self.pos += 1
+            elif char == "]":
+                self.pos += 1
+                # Skip any period the recorder put at the end of the phrase
+                while self.peek() in (".", " "):
+                    self.pos += 1
+                self.expect('"')
+                return recordings
+            elif char in ("(", "f"):
+                recordings.append(self.parse_recording())
+            else:
+                raise self.error("Expected a recording or ']'")
+
+    # Parses (file=..., videoStart=..., signStart=..., signEnd=..., isValid=..., attempt=...). Legacy
+    # recorders don't always close the parentheses, so a recording also ends at the next file= or ]
+    def parse_recording(self):
+        match = RECORDING.match(self.text, self.pos)
+        if (
+            match is not None
+            and (match.group().endswith(")") or self.text.startswith("]", match.end()))
+        ):
+            self.pos = match.end()
+            file, video_start, sign_start, sign_end, is_valid, attempt = match.groups()
+            return Recording(
+                unescape_value(file),
+                unescape_value(video_start),
+                unescape_value(sign_start),
+                unescape_value(sign_end),
+                True if is_valid is None else BOOLEANS[is_valid],
+                0 if attempt is None else int(attempt),
+            )
+
+        start = self.pos
+        fields = {}
+        if self.peek() == "(":
+            self.pos += 1
+
+        while True:
+            self.skip_whitespace()
+            char = self.peek()
+            if char == ")":
+                self.pos += 1
+                break
+            if char == ",":
+                self.pos += 1
+                continue
+            if char in ("]", "(") or (fields and self.text.startswith("file=", self.pos)):
+                break
+
+            match = FIELD.match(self.text, self.pos)
+            if match is None:
+                raise self.error("Expected name=value in recording")
+
+            name = FIELD_NAMES.get(match.group(1))
+            if name is None:
+                raise self.error(f"Unknown recording field {match.group(1)!r}", match.start(1))
+
+            fields[name] = self.parse_field(name, match)
+            self.pos = match.end()
+
+        missing = [name for name in REQUIRED_FIELDS if name not in fields]
+        if missing:
+            raise self.error(f"Recording is missing {', '.join(missing)}", start)
+
+        return Recording(
+            fields["file"],
+            fields["video_start"],
+            fields["sign_start"],
+            fields["sign_end"],
+            fields.get("is_valid", True),
+            fields.get("attempt", 0),
+        )
+
+    def parse_field(self, name, match):
+        value = unescape_value(match.group(2))
+
+        if name == "is_valid":
+            if value not in BOOLEANS:
+                raise self.error(f"Invalid isValid value {value!r}", match.start(2))
+            return BOOLEANS[value]
+        if name == "attempt":
+            if not value.isdigit():
+                raise self.error(f"Invalid attempt value {value!r}", match.start(2))
+            return int(value)
+        return value
@@ -0,0 +1,111 @@
+import struct
+
+from PIL import Image
+
+IMAGE_DESCRIPTION_TAG = 0x010E
+ASCII_TYPE = 2
+
+SOI = b"\xff\xd8"
+APP1 = 0xE1
+SOS = 0xDA
+EOI = 0xD9
+EXIF_HEADER = b"Exif\x00\x00"
+
+# Give up and let PIL handle files with more markers than this before the EXIF segment
+MAX_MARKERS = 32
+
+
+# Reads the EXIF ImageDescription of a timestamps jpg by only walking the JPEG marker chain and
+# the IFD0 entries of the EXIF segment, instead of decoding the image with PIL. Falls back to PIL
+# for anything unusual so the result always matches read_image_description_pil
+def read_image_description(path):
+    try:
+        with open(path, "rb") as f:
+            description = read_image_description_fast(f)
+    except (OSError, struct.error):
+        description = None
+
+    if description is None:
+        return read_image_description_pil(path)
+    return description
+
+
+# Same result as the Image.open(path).getexif() + TAGS lookup decode_split_by_length.py used to do
+# (get_image_description in scripts/bench_exif_reader.py)
+def read_image_description_pil(path):
+    with Image.open(path) as image:
+        description = image.getexif().get(IMAGE_DESCRIPTION_TAG, "")
+    if isinstance(description, bytes):
+        description = description.decode()
+    return description
+
+
+# Returns the description, "" if the file has no ImageDescription, or None if the file needs to
+# go through PIL instead. Only reads the marker headers and the EXIF segment
+def read_image_description_fast(f):
+    if f.read(2) != SOI:
+        return None
+
+    exif = None
+    for _ in range(MAX_MARKERS):
+        header = f.read(4)
+        if len(header) < 4 or header[0] != 0xFF:
+            return None
+
+        marker = header[1]
+        if marker in (SOS, EOI):
+            break
+
+        length = struct.unpack(">H", header[2:])[0]
+        if marker == APP1:
+            segment = f.read(length - 2)
+            if segment.startswith(EXIF_HEADER):
+                # PIL merges EXIF that is split over several segments, leave that case to it
+                if exif is not None:
+                    return None
+                exif = segment[len(EXIF_HEADER):]
+                continue
+        else:
+            f.seek(length - 2, 1)
+    else:
+        return None
+
+    if exif is None:
+        return ""
+    return get_description_from_tiff(exif)
+
+
+def get_description_from_tiff(tiff):
+    if tiff[:4] == b"II*\x00":
+        endian = "<"
+    elif tiff[:4] == b"MM\x00*":
+        endian = ">"
+    else:
+        return None
+
+    ifd0_offset = struct.unpack(endian + "I", tiff[4:8])[0]
+    entry_count = struct.unpack(endian + "H", tiff[ifd0_offset:ifd0_offset + 2])[0]
+
+    for i in range(entry_count):
+        entry_offset = ifd0_offset + 2 + 12 * i
+        tag, tag_type, count = struct.unpack(endian + "HHI", tiff[entry_offset:entry_offset + 8])
+        if tag != IMAGE_DESCRIPTION_TAG:
+            continue
+
+        if tag_type != ASCII_TYPE:
+            return None
+
+        if count <= 4:
+            data = tiff[entry_offset + 8:entry_offset + 8 + count]
+        else:
+            value_offset = struct.unpack(endian + "I", tiff[entry_offset + 8:entry_offset + 12])[0]
+            data = tiff[value_offset:value_offset + count]
+            if len(data) != count:
+                return None
+
+        # Decode the same way PIL decodes ASCII tags
+        if data.endswith(b"\x00"):
+            data = data[:-1]
+        return data.decode("latin-1", "replace")
+
+    return ""
@@ -0,0 +1,68 @@
+import sqlite3
+
+# Query parameters /clips filters on, the columns of the decoder's clip catalog (clip_catalog.py)
+CLIP_FILTERS = ("batch", "uid", "sign", "attempt", "is_valid", "rejected")
+BOOLEAN_FILTERS = ("is_valid", "rejected")
+MAX_PAGE_SIZE = 500
+
+
+class CatalogNotFound(Exception):
+    pass
+
+
+# The catalog is written by decode_split_by_length.py, the app only ever reads it
+def connect(path):
+    try:
+        connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    except sqlite3.OperationalError:
+        raise CatalogNotFound(path)
+    connection.row_factory = sqlite3.Row
+    return connection
+
+
+def get_filter_value(name, value):
+    if name in BOOLEAN_FILTERS:
+        return int(value.lower() in ("1", "true", "yes"))
+    if name == "attempt":
+        return int(value)
+    return value
+
+
+# One page of the clips matching filters (column -> value), in batch/sign/uid/path order so pages
+# are stable and come straight off the catalog's indexes. Returns (total matching clips, page rows)
+def query_clips(path, filters, page, page_size):
+    where = " AND ".join(f"{name} = ?" for name in filters) or "1"
+    values = [get_filter_value(name, value) for name, value in filters.items()]
+
+    connection = connect(path)
+    try:
+        total = connection.execute(f"SELECT COUNT(*) FROM clips WHERE {where}", values).fetchone()[0]
+        rows = connection.execute(
+            f"SELECT path, batch, uid, sign, attempt, is_valid, rejected, duration, size, updated_at "
+            f"FROM clips WHERE {where} ORDER BY batch, sign, uid, path LIMIT ? OFFSET ?",
+            values + [page_size, (page - 1) * page_size],
+        ).fetchall()
+    finally:
+        connection.close()
+
+    clips = []
+    for row in rows:
+        clip = dict(row)
+        clip["is_valid"] = bool(clip["is_valid"])
+        clip["rejected"] = bool(clip["rejected"])
+        clips.append(clip)
+    return total, clips
+
+
+# Clip count of every sign of every batch, what a batch picker needs without listing any clip
+def query_batches(path):
+    connection = connect(path)
+    try:
+        rows = connection.execute("SELECT batch, sign, COUNT(*) FROM clips GROUP BY batch, sign").fetchall()
+    finally:
+        connection.close()
+
+    batches = {}
+    for batch, sign, count in rows:
+        batches.setdefault(batch, {})[sign] = count
+    return batches
@@ -0,0 +1,83 @@
+import io
+import os
+
+import numpy as np
+
+from smart_cut import get_thread_args, run_captured
+
+# Index of the .npy clips in --dest_dir, see get_frames_index_entry
+FRAMES_INDEX_FILENAME = "frames_index.jsonl"
+
+
+# --video_dim is width, height (as for the CUDA scale filter), frames are stored as
+# (frames, height, width, 3) RGB
+def get_frame_shape(video_dim):
+    width, height = video_dim
+    return height, width, 3
+
+
+# .npy header of uint8 frames of the given shape. NumPy pads it for the first axis to grow, so the
+# header of any frame count has the same length and can be rewritten in place
+def get_npy_header(shape):
+    header = io.BytesIO()
+    np.lib.format.write_array_header_1_0(header, {"descr": "|u1", "fortran_order": False, "shape": shape})
+    return header.getvalue()
+
+
+# Decodes [start, end) of the clip's source straight to RGB frames scaled to --video_dim and saves
+# them as an uncompressed .npy at clip["output"], which np.load(..., mmap_mode="r") maps without
+# copying. Rounds start/length like the mp4 path and keeps ffmpeg's constant frame rate output,
+# so the frames are the frames of the mp4 clip. ffmpeg writes the frames right into the file after
+# a header for no frames, which is rewritten with the frame count once ffmpeg is done, so the clip
+# is never held in memory
+def extract_clip_frames(clip, video_dim, loglevel="fatal", threads=None):
+    start = clip["start"]
+    time = clip["end"] - clip["start"]
+    width, height = video_dim
+    frame_shape = get_frame_shape(video_dim)
+
+    with open(clip["output"], "wb") as f:
+        header_size = f.write(get_npy_header((0, *frame_shape)))
+        f.flush()
+        run_captured(
+            [
+                "ffmpeg", "-nostdin", "-loglevel", loglevel,
+                *get_thread_args(threads),
+                "-ss", f"{start:.2f}",
+                "-i", clip["videopath"],
+                "-t", f"{time:.2f}",
+                "-an",
+                "-vf", f"scale={width}:{height}",
+                "-fps_mode", "cfr",
+                "-pix_fmt", "rgb24",
+                "-f", "rawvideo",
+                "pipe:1",
+            ],
+            stdout=f,
+        )
+
+        frame_count = (f.seek(0, os.SEEK_END) - header_size) // int(np.prod(frame_shape))
+        header = get_npy_header((frame_count, *frame_shape))
+        if len(header) != header_size:
+            raise ValueError(f"{clip['output']}: .npy header of {frame_count} frames doesn't fit")
+        f.seek(0)
+        f.write(header)
+
+
+# Index entry of a clip: its .npy (relative to --dest_dir), the shape of its frames and the clip's
+# metadata, so a training loader can find and slice clips without opening every file. The .npy is
+# only mapped to read its header
+def get_frames_index_entry(args, clip):
+    shape = np.load(clip["output"], mmap_mode="r").shape
+
+    return {
+        "clip": os.path.relpath(clip["output"], args.dest_dir),
+        "frames": shape[0],
+        "shape": list(shape),
+        "uid": clip["uid"],
+        "sign": clip["sign"],
+        "start": clip["start"],
+        "end": clip["end"],
+        "is_valid": clip["is_valid"],
+        "reject": clip["reject"],
+    }
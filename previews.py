@@ -0,0 +1,48 @@
+import os
+import shlex
+
+from smart_cut import get_thread_args, run_ffmpeg
+
+# Seconds between keyframes of a preview, so the annotation UI can seek and loop anywhere in a clip
+# without decoding from far back
+PREVIEW_KEYFRAME_INTERVAL = 0.5
+
+PREVIEW_CRF = 28
+PREVIEW_AUDIO_BITRATE = "64k"
+
+
+# Previews mirror the layout of the clips under --dest_dir (including --make_sign_dirs/--make_structured_dirs
+# and the invalid folder) in --preview_dir
+def get_preview_path(args, output):
+    return os.path.join(args.preview_dir, os.path.relpath(output, args.dest_dir))
+
+
+# ffmpeg output options of a preview: scaled down to --preview_height, a keyframe every
+# PREVIEW_KEYFRAME_INTERVAL seconds, and the moov atom at the front (faststart) so the browser can
+# start playing before the whole file arrived
+def get_preview_output_args(height, preview, threads=None):
+    return [
+        "-vf", f"scale=-2:{height}",
+        "-c:v", "libx264",
+        *get_thread_args(threads),
+        "-preset", "veryfast",
+        "-crf", str(PREVIEW_CRF),
+        "-pix_fmt", "yuv420p",
+        "-force_key_frames", f"expr:gte(t,n_forced*{PREVIEW_KEYFRAME_INTERVAL})",
+        "-c:a", "aac",
+        "-b:a", PREVIEW_AUDIO_BITRATE,
+        "-movflags", "+faststart",
+        "-f", "mp4",
+        preview,
+    ]
+
+
+# Same as get_preview_output_args for the shell command of decode_split_by_length.run_clip
+def get_preview_shell_args(height, preview, threads=None):
+    return shlex.join(get_preview_output_args(height, preview, threads))
+
+
+# Makes the preview of a clip that was already written, for the cut modes/backends that don't
+# decode the clip in a single ffmpeg process (--cut_mode smart, --use_cuda, --backend av)
+def make_preview(clip_path, height, preview, loglevel="fatal", threads=None):
+    run_ffmpeg(loglevel, *get_thread_args(threads), "-i", clip_path, *get_preview_output_args(height, preview, threads))
@@ -0,0 +1,156 @@
+import json
+import os
+import subprocess
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from fractions import Fraction
+
+from decode_ledger import connect_database
+from smart_cut import probe_video_packets
+
+STREAM_ENTRIES = "index,codec_type,codec_name,avg_frame_rate,width,height,sample_rate,channels"
+
+# ffprobe failing, or output probe_source can't read (broken JSON, missing fields, N/A numbers).
+# Either way the source counts as unprobed
+PROBE_ERRORS = (subprocess.CalledProcessError, ValueError, KeyError)
+
+
+def parse_frame_rate(frame_rate):
+    try:
+        return float(Fraction(frame_rate))
+    except (ValueError, ZeroDivisionError):
+        return None
+
+
+# Probes a source once: duration, video frame rate, every stream and the pts of every video packet
+# with the keyframes among them (see smart_cut.probe_video_packets). Only reads headers, nothing is
+# decoded
+def probe_source(videopath):
+    result = subprocess.run(
+        [
+            "ffprobe",
+            "-v", "error",
+            "-show_entries", f"format=duration:stream={STREAM_ENTRIES}",
+            "-of", "json",
+            videopath,
+        ],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    info = json.loads(result.stdout)
+    codec, packets = probe_video_packets(videopath)
+
+    streams = info.get("streams", [])
+    video_streams = [stream for stream in streams if stream.get("codec_type") == "video"]
+    return {
+        "duration": float(info.get("format", {}).get("duration", 0) or 0),
+        "frame_rate": parse_frame_rate(video_streams[0].get("avg_frame_rate", "0/0")) if video_streams else None,
+        "codec": codec,
+        "streams": streams,
+        "frame_times": [pts for pts, _ in packets],
+        "keyframes": [pts for pts, is_key in packets if is_key],
+    }
+
+
+# The (codec, packets) smart_cut.smart_cut_clip takes, rebuilt from a cached probe
+def get_smart_cut_probe(probe):
+    keyframes = set(probe["keyframes"])
+    return probe["codec"], [(pts, pts in keyframes) for pts in probe["frame_times"]]
+
+
+# Sidecar SQLite cache of probe_source results, kept in --dest_dir and keyed by path, size and
+# mtime so a replaced source is probed again. Probes are stored as compressed JSON since the packet
+# times of a long session take a few hundred KB. read_only: only look probes up, in a cache that
+# already exists (the extraction workers)
+class ProbeCache:
+    def __init__(self, path, read_only=False):
+        self.lock = threading.Lock()
+        self.connection = connect_database(path, read_only)
+        if read_only:
+            return
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS probes (
+                videopath TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                probe BLOB NOT NULL
+            )
+            """
+        )
+        self.connection.commit()
+
+    def get(self, videopath):
+        videopath = os.path.abspath(videopath)
+        stat = os.stat(videopath)
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT probe FROM probes WHERE videopath = ? AND size = ? AND mtime_ns = ?",
+                (videopath, stat.st_size, stat.st_mtime_ns),
+            ).fetchone()
+        return json.loads(zlib.decompress(row[0])) if row is not None else None
+
+    def put(self, videopath, probe):
+        videopath = os.path.abspath(videopath)
+        stat = os.stat(videopath)
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO probes (videopath, size, mtime_ns, probe) VALUES (?, ?, ?, ?)",
+                (videopath, stat.st_size, stat.st_mtime_ns, zlib.compress(json.dumps(probe).encode())),
+            )
+            self.connection.commit()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+# Probes sources on a few threads of the main process (ffprobe does the work, so threads are
+# enough) as soon as they are listed, ahead of planning and extraction. The full probes (with every
+# frame time and keyframe) only go to the cache the workers read, in memory there is just the
+# duration of every source. get() only blocks if the source hasn't been probed yet, and returns None
+# for sources ffprobe can't read (extraction reports those). metrics: optional DecodeMetrics the
+# probe times are recorded in
+class SourceProber:
+    def __init__(self, cache_path, threads, metrics=None):
+        self.cache = ProbeCache(cache_path)
+        self.executor = ThreadPoolExecutor(threads)
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        self.futures = {}
+
+    def probe(self, videopath):
+        if not os.path.exists(videopath):
+            return None
+        probe = self.cache.get(videopath)
+        if probe is None:
+            started = time.perf_counter()
+            try:
+                probe = probe_source(videopath)
+            except PROBE_ERRORS:
+                return None
+            self.cache.put(videopath, probe)
+            if self.metrics is not None:
+                self.metrics.record("probe", time.perf_counter() - started, source=videopath)
+        return probe
+
+    def probe_duration(self, videopath):
+        probe = self.probe(videopath)
+        return probe["duration"] if probe is not None else None
+
+    def submit(self, videopath):
+        with self.lock:
+            if videopath not in self.futures:
+                self.futures[videopath] = self.executor.submit(self.probe_duration, videopath)
+            return self.futures[videopath]
+
+    # Duration of the source, None if ffprobe couldn't read it
+    def get(self, videopath):
+        return self.submit(videopath).result()
+
+    def close(self):
+        self.executor.shutdown()
+        self.cache.close()
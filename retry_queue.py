@@ -0,0 +1,67 @@
+import datetime
+import json
+import os
+import re
+import subprocess
+import traceback
+
+from clip_manifest import get_manifest_entry
+
+# ffmpeg errors that come from the source itself (truncated upload, missing moov atom, garbage
+# stream). Running ffmpeg on the same bytes again fails the same way, so these aren't retried
+PERSISTENT_ERRORS = re.compile(
+    r"Invalid data found when processing input|moov atom not found|No such file or directory|"
+    r"does not contain any stream|Invalid argument"
+)
+
+# Only the end of ffmpeg's log is kept, that is where the error is
+STDERR_TAIL = 4000
+
+
+def get_stderr(error):
+    stderr = getattr(error, "stderr", None)
+    if isinstance(stderr, bytes):
+        stderr = stderr.decode(errors="replace")
+    return (stderr or "")[-STDERR_TAIL:]
+
+
+# Failure of a clip as a dict the workers can send back: the error, the tail of ffmpeg's log and
+# whether retrying could help. Failed ffmpeg runs and OS errors (full disk, NFS hiccups) are retried
+# unless their log points at the source, anything else is a bug or a broken source and isn't
+def get_failure(error):
+    stderr = get_stderr(error)
+    if isinstance(error, (subprocess.CalledProcessError, OSError)):
+        persistent = PERSISTENT_ERRORS.search(stderr or str(error)) is not None
+    else:
+        persistent = True
+        stderr = stderr or "".join(traceback.format_exception(type(error), error, error.__traceback__))[-STDERR_TAIL:]
+    return {"error": str(error), "stderr": stderr, "persistent": persistent}
+
+
+# Seconds to wait before the given retry (1, 2, ...), doubling every time
+def get_backoff(backoff, retry):
+    return backoff * 2 ** (retry - 1)
+
+
+# Appends the clips that still failed after their retries to a JSONL retry queue. Every line is a
+# manifest line (see clip_manifest) plus the failure, so the queue can be run again as is with
+# execute --manifest once the sources are fixed
+def write_retry_queue(path, clips, failures):
+    failed_at = datetime.datetime.now().isoformat(timespec="seconds")
+    with open(path, "a") as f:
+        for clip, failure in zip(clips, failures):
+            entry = get_manifest_entry(clip)
+            entry.update(
+                failed_at=failed_at,
+                attempts=failure["attempts"],
+                error=failure["error"],
+                stderr=failure["stderr"],
+            )
+            f.write(json.dumps(entry) + "\n")
+
+
+# Removes whatever a failed attempt left of the partial outputs of a clip
+def remove_partial_outputs(paths):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
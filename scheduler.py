@@ -0,0 +1,226 @@
+import datetime
+import math
+import os
+import threading
+import time
+from collections import namedtuple
+
+# ffmpeg -threads values the scheduler picks from
+THREAD_CHOICES = (1, 2, 4, 8, 16)
+
+# Jobs are bucketed by how many seconds of video they encode, since short tap clips are dominated
+# by ffmpeg startup/seek and long holds (or whole --extract_mode source groups) by encoding.
+# (name, max seconds, starting -threads)
+JOB_CLASSES = (
+    ("short", 3.0, 1),
+    ("medium", 15.0, 2),
+    ("long", math.inf, 4),
+)
+
+# Measurements are exponential moving averages so the estimates follow the machine's load
+SMOOTHING = 0.3
+MIN_SAMPLES = 3
+# Every this many jobs of a class, try a neighbouring thread count instead of the best one
+EXPLORE_EVERY = 8
+
+# How often the budget is adjusted from CPU idle, and the idle fractions that trigger it
+ADAPT_INTERVAL = 10.0
+HIGH_IDLE = 0.15
+LOW_IDLE = 0.03
+# The budget can grow past the number of cores when ffmpeg spends time waiting on IO
+MAX_OVERCOMMIT = 2
+
+Ticket = namedtuple("Ticket", ["job_class", "threads", "cores", "video_seconds"])
+
+
+# Cores this process may run on: the Slurm cgroup/affinity mask on a shared node, not every core
+# of the host. Falls back to the host's count where there are no affinity masks (macOS)
+def get_available_cpus():
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count()
+
+
+# Returns (idle, total) jiffies summed over every core, or None where /proc/stat doesn't exist
+def read_cpu_times():
+    try:
+        with open("/proc/stat") as f:
+            fields = [int(field) for field in f.readline().split()[1:]]
+    except (OSError, ValueError):
+        return None
+    # idle + iowait
+    return fields[3] + fields[4], sum(fields)
+
+
+def get_job_class(video_seconds):
+    for name, max_seconds, _ in JOB_CLASSES:
+        if video_seconds < max_seconds:
+            return name
+
+
+# Treats the machine's cores as a budget shared by every ffmpeg process, instead of running a fixed
+# number of processes that each start as many threads as they like. For each class of job it picks
+# the -threads value that costs the least CPU time per second of video (measured from the finished
+# jobs' CPU time), and only starts a job once the cores it is expected to use fit in the budget.
+#
+# Every ADAPT_INTERVAL it samples clips/sec and CPU idle. If the CPU is idle while jobs are waiting
+# for cores, the processes use less CPU than estimated (IO, seeking) so the budget grows. If the CPU
+# is idle while nothing is waiting, there aren't enough jobs to fill the machine (e.g. the tail of a
+# run) so each process gets more threads instead. The settings are appended to log_file
+class AdaptiveScheduler:
+    def __init__(self, cpu_budget, log_file=None):
+        self.cpu_budget = cpu_budget
+        self.budget = cpu_budget
+        self.max_budget = cpu_budget * MAX_OVERCOMMIT
+        self.log_file = log_file
+
+        self.condition = threading.Condition()
+        self.cores_in_use = 0.0
+        self.jobs_in_use = 0
+        self.waited = False
+        self.starved = False
+
+        self.threads = {name: min(threads, cpu_budget) for name, _, threads in JOB_CLASSES}
+        self.job_counts = {name: 0 for name, _, _ in JOB_CLASSES}
+        # (job class, threads) -> [samples, cpu seconds per video second, cores used]
+        self.estimates = {}
+
+        self.clips_done = 0
+        self.last_clips_done = 0
+        self.last_adapt = time.monotonic()
+        self.last_cpu_times = read_cpu_times()
+
+        self.log(
+            f"adaptive scheduler: cpu_budget={cpu_budget} max_budget={self.max_budget} "
+            f"threads={self.format_threads()}"
+        )
+
+    # Pool size needed so the budget is never limited by the number of workers
+    @property
+    def max_processes(self):
+        return self.max_budget
+
+    def log(self, message):
+        if self.log_file is None:
+            return
+        with open(self.log_file, "a") as f:
+            f.write(f"{datetime.datetime.now().isoformat(timespec='seconds')} {message}\n")
+
+    def format_threads(self):
+        return ",".join(f"{name}:{threads}" for name, threads in self.threads.items())
+
+    def get_estimate(self, job_class, threads):
+        estimate = self.estimates.get((job_class, threads))
+        if estimate is None or estimate[0] < MIN_SAMPLES:
+            return None
+        return estimate
+
+    # Cheapest measured thread count for the class, every EXPLORE_EVERY jobs one of its neighbours
+    # that hasn't been measured as much gets tried instead
+    def choose_threads(self, job_class):
+        self.job_counts[job_class] += 1
+        current = self.threads[job_class]
+        choices = [threads for threads in THREAD_CHOICES if threads <= self.cpu_budget] or [1]
+
+        measured = {
+            threads: estimate[1]
+            for threads in choices
+            for estimate in [self.get_estimate(job_class, threads)]
+            if estimate is not None
+        }
+        if current in measured:
+            cheapest = min(measured.values())
+            # Anything within 10% of the cheapest is as good, so prefer more threads for lower latency
+            best = max(threads for threads in measured if measured[threads] <= cheapest * 1.1)
+            if best != current:
+                self.threads[job_class] = best
+                self.log(f"threads: {job_class} {current} -> {best} ({self.format_threads()})")
+            current = best
+
+        index = choices.index(current) if current in choices else 0
+        if self.starved:
+            return choices[min(index + 1, len(choices) - 1)]
+
+        if self.job_counts[job_class] % EXPLORE_EVERY == 0:
+            neighbours = choices[max(index - 1, 0):index] + choices[index + 1:index + 2]
+            if neighbours:
+                return min(neighbours, key=lambda threads: self.estimates.get((job_class, threads), [0])[0])
+        return current
+
+    # Blocks until the job fits in the budget. At least one job always runs, however big it is
+    def acquire(self, video_seconds):
+        job_class = get_job_class(video_seconds)
+        with self.condition:
+            threads = self.choose_threads(job_class)
+            estimate = self.get_estimate(job_class, threads)
+            cores = estimate[2] if estimate is not None else threads
+
+            while self.jobs_in_use and self.cores_in_use + cores > self.budget:
+                self.waited = True
+                self.condition.wait()
+
+            self.cores_in_use += cores
+            self.jobs_in_use += 1
+        return Ticket(job_class, threads, cores, video_seconds)
+
+    # elapsed/cpu_time: wall clock and ffmpeg CPU seconds of the job, None if the job failed
+    def release(self, ticket, elapsed=None, cpu_time=None, clip_count=0):
+        with self.condition:
+            self.cores_in_use -= ticket.cores
+            self.jobs_in_use -= 1
+            self.clips_done += clip_count
+
+            if elapsed and cpu_time and ticket.video_seconds > 0:
+                key = (ticket.job_class, ticket.threads)
+                sample = [cpu_time / ticket.video_seconds, max(cpu_time / elapsed, 0.1)]
+                estimate = self.estimates.get(key)
+                if estimate is None:
+                    self.estimates[key] = [1, *sample]
+                else:
+                    estimate[0] += 1
+                    estimate[1] += SMOOTHING * (sample[0] - estimate[1])
+                    estimate[2] += SMOOTHING * (sample[1] - estimate[2])
+
+            self.adapt()
+            self.condition.notify_all()
+
+    def adapt(self):
+        now = time.monotonic()
+        if now - self.last_adapt < ADAPT_INTERVAL:
+            return
+
+        clips_per_sec = (self.clips_done - self.last_clips_done) / (now - self.last_adapt)
+        cpu_times = read_cpu_times()
+        idle = None
+        if cpu_times is not None and self.last_cpu_times is not None:
+            total = cpu_times[1] - self.last_cpu_times[1]
+            idle = (cpu_times[0] - self.last_cpu_times[0]) / total if total else None
+
+        budget = self.budget
+        self.starved = False
+        if idle is not None and idle > HIGH_IDLE:
+            if self.waited:
+                self.budget = min(self.budget + max(self.cpu_budget // 8, 1), self.max_budget)
+            else:
+                self.starved = True
+        elif idle is not None and idle < LOW_IDLE and self.budget > self.cpu_budget:
+            self.budget = max(self.budget - max(self.cpu_budget // 8, 1), self.cpu_budget)
+
+        idle_text = "n/a" if idle is None else f"{idle:.2f}"
+        self.log(
+            f"clips/sec={clips_per_sec:.2f} cpu_idle={idle_text} budget={budget}->{self.budget} "
+            f"jobs={self.jobs_in_use} cores={self.cores_in_use:.1f} starved={self.starved} "
+            f"threads={self.format_threads()}"
+        )
+
+        self.waited = False
+        self.last_adapt = now
+        self.last_clips_done = self.clips_done
+        self.last_cpu_times = cpu_times
+
+    def close(self):
+        estimates = " ".join(
+            f"{job_class}/{threads}:{estimate[1]:.2f}cpu_s_per_s,{estimate[2]:.1f}cores(n={estimate[0]})"
+            for (job_class, threads), estimate in sorted(self.estimates.items())
+        )
+        self.log(f"finished: clips={self.clips_done} threads={self.format_threads()} {estimates}")
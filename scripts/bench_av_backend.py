@@ -0,0 +1,144 @@
+# Compares the ffmpeg backend (one ffmpeg process per clip, decode_split_by_length.run_clip) with
+# --backend av (av_backend.extract_clips_av, in-process PyAV) on short tap clips. Reports the time
+# per clip of both and checks that every clip has the same number of frames and a PSNR above
+# --min_psnr against the ffmpeg clip.
+#
+# Usage: python scripts/bench_av_backend.py [--source VIDEO] [--clips N] [--clip_length SECONDS]
+# Without --source, a synthetic testsrc video with audio is generated in a temp directory.
+import argparse
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import av
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from av_backend import close_source, extract_clips_av
+from decode_split_by_length import run_clip
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--source", type=str, default=None, help="Source video to cut, e.g. a real session video")
+    parser.add_argument("--clips", type=int, default=40)
+    parser.add_argument("--clip_length", type=float, default=1.0, help="Average clip length in seconds")
+    parser.add_argument("--video_size", type=str, default="1280x720", help="Size of the synthetic source")
+    parser.add_argument("--min_psnr", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+def make_source(path, size, duration):
+    subprocess.run(
+        [
+            "ffmpeg", "-v", "error", "-y",
+            "-f", "lavfi", "-i", f"testsrc=size={size}:rate=30",
+            "-f", "lavfi", "-i", "sine",
+            "-t", f"{duration:.2f}",
+            "-c:v", "libx264", "-pix_fmt", "yuv420p", "-g", "30",
+            "-c:a", "aac",
+            path,
+        ],
+        check=True,
+    )
+
+
+def get_duration(path):
+    with av.open(path) as container:
+        return container.duration / av.time_base
+
+
+# Back to back tap clips like plan_clips makes them: each clip starts half a second before the
+# previous one ends
+def make_clips(videopath, output_dir, count, clip_length, duration, seed):
+    rng = random.Random(seed)
+    clips = []
+    start = 0.2
+    for i in range(count):
+        length = rng.uniform(0.5 * clip_length, 1.5 * clip_length)
+        if start + length > duration:
+            break
+        clips.append({
+            "videopath": videopath,
+            "start": start,
+            "end": start + length,
+            "output": os.path.join(output_dir, f"clip-{i}.mp4"),
+            "is_valid": True,
+            "filename": videopath,
+            "sign": f"sign{i}",
+        })
+        start += length - 0.5
+    return clips
+
+
+def read_frames(path):
+    with av.open(path) as container:
+        return [frame.to_ndarray(format="gray").astype(np.float64) for frame in container.decode(video=0)]
+
+
+def get_psnr(frames, reference):
+    mse = np.mean([np.mean((frame - ref) ** 2) for frame, ref in zip(frames, reference)])
+    return math.inf if mse == 0 else 10 * math.log10(255 ** 2 / mse)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source = args.source
+        if source is None:
+            source = os.path.join(tmp_dir, "source.mp4")
+            make_source(source, args.video_size, args.clips * args.clip_length * 0.6 + 2)
+        duration = get_duration(source)
+
+        ffmpeg_dir = os.path.join(tmp_dir, "ffmpeg")
+        av_dir = os.path.join(tmp_dir, "av")
+        os.makedirs(ffmpeg_dir)
+        os.makedirs(av_dir)
+        ffmpeg_clips = make_clips(source, ffmpeg_dir, args.clips, args.clip_length, duration, args.seed)
+        av_clips = [dict(clip, output=os.path.join(av_dir, os.path.basename(clip["output"]))) for clip in ffmpeg_clips]
+
+        # run_clip's output is redirected so only the numbers are printed
+        clip_args = argparse.Namespace(use_cuda=False, cut_mode="encode", ffmpeg_loglevel="fatal")
+        stderr = os.dup(2)
+        os.dup2(os.open(os.devnull, os.O_WRONLY), 2)
+        started = time.perf_counter()
+        for clip in ffmpeg_clips:
+            run_clip(clip_args, clip)
+        ffmpeg_time = time.perf_counter() - started
+        os.dup2(stderr, 2)
+
+        started = time.perf_counter()
+        for clip in av_clips:
+            extract_clips_av([clip])
+        av_clip_time = time.perf_counter() - started
+        close_source()
+
+        started = time.perf_counter()
+        extract_clips_av(av_clips)
+        av_source_time = time.perf_counter() - started
+        close_source()
+
+        count = len(ffmpeg_clips)
+        print(f"{count} clips of ~{args.clip_length:.1f}s from {source}")
+        print(f"ffmpeg     : {ffmpeg_time:.2f}s ({1000 * ffmpeg_time / count:.0f} ms/clip)")
+        print(f"av (clip)  : {av_clip_time:.2f}s ({1000 * av_clip_time / count:.0f} ms/clip), {ffmpeg_time / av_clip_time:.1f}x")
+        print(f"av (source): {av_source_time:.2f}s ({1000 * av_source_time / count:.0f} ms/clip), {ffmpeg_time / av_source_time:.1f}x")
+
+        failures = 0
+        worst_psnr = math.inf
+        for ffmpeg_clip, av_clip in zip(ffmpeg_clips, av_clips):
+            reference = read_frames(ffmpeg_clip["output"])
+            frames = read_frames(av_clip["output"])
+            psnr = get_psnr(frames, reference)
+            worst_psnr = min(worst_psnr, psnr)
+            if len(frames) != len(reference) or psnr < args.min_psnr:
+                failures += 1
+                print(f"  {os.path.basename(av_clip['output'])}: {len(frames)} frames vs {len(reference)}, PSNR {psnr:.1f}dB")
+        print(f"{count - failures}/{count} clips match the ffmpeg backend (worst PSNR {worst_psnr:.1f}dB)")
@@ -0,0 +1,170 @@
+# Benchmarks description_parser.parse_description against the regex chain + eval parser that
+# decode_split_by_length.py used before, and checks both give the same recordings.
+#
+# Usage: python scripts/bench_description_parser.py [--backup_dir DIR] [--count N] [--signs N] [--repeat R]
+# Without --backup_dir a synthetic corpus is generated for each recorder version: v1 (no isValid),
+# v2 (isValid) and v3 (isValid + attempt). With --backup_dir the descriptions of every
+# -timestamps.jpg in it are used instead.
+#
+# Outputs are compared after the legacy parser's quirks are normalized: signs go through
+# clean_sign (the legacy parser rewrote a few contractions before eval) and legacy recordings are
+# padded with the isValid=True/attempt=0 defaults the new parser fills in.
+import argparse
+import datetime
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from description_parser import DescriptionParseError, clean_sign, parse_description
+from exif_reader import read_image_description
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backup_dir", type=str, default=None, help="Directory of real -timestamps.jpg files")
+    parser.add_argument("--count", type=int, default=1000, help="Synthetic descriptions per recorder version")
+    parser.add_argument("--signs", type=int, default=40, help="Signs per synthetic description")
+    parser.add_argument("--repeat", type=int, default=3)
+    return parser.parse_args()
+
+
+def clean_contractions(input_string):
+    input_string = re.sub(r'pet\'s name', 'pets name', input_string)
+    input_string = re.sub(r'don\'t', 'dont', input_string)
+    return input_string
+
+
+# The parser decode_split_by_length.py used before description_parser
+def legacy_parse(description):
+    is_valid_exists = "isValid" in description
+
+    subbed = re.sub(r"file=(.*?),", r'"\1",', description)
+    subbed = re.sub(r"videoStart=(.*?),", r'"\1",', subbed)
+    subbed = re.sub(r"signStart=(.*?),", r'"\1",', subbed)
+
+    if is_valid_exists:
+        subbed = re.sub(r"signEnd=(.*?),", r'"\1",', subbed)
+        subbed = re.sub(r"isValid=(.*?),", r'\1,', subbed)
+    else:
+        subbed = re.sub(r"signEnd=(.*?),", r'"\1")', subbed)
+
+    subbed = re.sub(r'\\/', '/', subbed)
+    subbed = re.sub(r'"\[', '[', subbed)
+    subbed = re.sub(r'\]"', ']', subbed)
+    subbed = re.sub(r'\\r', '', subbed)
+    subbed = re.sub(r'\."', '"', subbed)
+
+    subbed = re.sub(r'attempt=(.*?)', r'\1', subbed)
+    subbed = re.sub(r'isValid=(.*?)', r'\1', subbed)
+
+    subbed = clean_contractions(subbed)
+
+    return eval(subbed)
+
+
+def timestamp(base, seconds):
+    t = base + datetime.timedelta(seconds=seconds)
+    return t.strftime("%Y_%m_%d_%H_%M_%S.") + f"{t.microsecond // 1000:03d}"
+
+
+def make_description(version, index, signs):
+    base = datetime.datetime(2023, 5, 1, 10, 0, 0) + datetime.timedelta(minutes=index)
+    video = f"\\/storage\\/emulated\\/0\\/Movies\\/4a.2.{1000 + index % 50}-session{index}.mp4"
+    names = ["apple", "don't", "pet's name", "Are you deaf.", "thank you", "mother / father"]
+
+    entries = []
+    for i in range(signs):
+        sign = names[i % len(names)] + ("" if i < len(names) else str(i))
+        start = 1 + 2 * i
+        end = start + (0.2 if i % 3 else 1.5)
+        fields = (
+            f"file={video}, videoStart={timestamp(base, 0)}, "
+            f"signStart={timestamp(base, start)}, signEnd={timestamp(base, end)}, "
+        )
+        if version == "v1":
+            recordings = f"({fields}]"
+        elif version == "v2":
+            recordings = f"({fields}isValid={i % 7 != 0})]"
+        else:
+            recordings = f"({fields}isValid={i % 7 != 0}, attempt=1), ({fields}isValid=True, attempt=2)]"
+        entries.append(f'"{sign}": "[{recordings}"')
+
+    return "{" + ", ".join(entries) + "}"
+
+
+def normalize_legacy(data):
+    return {
+        clean_sign(sign): [tuple(recording) + (True, 0)[len(recording) - 4:] for recording in recordings]
+        for sign, recordings in data.items()
+        if isinstance(recordings, list)
+    }
+
+
+def normalize_new(data):
+    return {
+        clean_sign(sign): [tuple(recording) for recording in recordings]
+        for sign, recordings in data.items()
+        if isinstance(recordings, list)
+    }
+
+
+def bench(name, parse, descriptions, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for description in descriptions:
+            try:
+                parse(description)
+            except Exception:
+                pass
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run_corpus(name, descriptions, repeat):
+    legacy_failures = 0
+    new_failures = 0
+    mismatches = 0
+    for description in descriptions:
+        try:
+            expected = normalize_legacy(legacy_parse(description))
+        except Exception:
+            legacy_failures += 1
+            expected = None
+
+        try:
+            actual = normalize_new(parse_description(description))
+        except DescriptionParseError:
+            new_failures += 1
+            actual = None
+
+        if expected is not None and actual != expected:
+            mismatches += 1
+
+    legacy_time = bench("legacy", legacy_parse, descriptions, repeat)
+    new_time = bench("parser", parse_description, descriptions, repeat)
+    print(
+        f"{name:>6}: {len(descriptions)} descriptions, legacy {legacy_time:.3f}s, parser {new_time:.3f}s, "
+        f"speedup {legacy_time / new_time:.1f}x | legacy failures {legacy_failures}, "
+        f"parser failures {new_failures}, mismatches {mismatches}"
+    )
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    if args.backup_dir is not None:
+        descriptions = [
+            read_image_description(os.path.join(args.backup_dir, filename))
+            for filename in sorted(os.listdir(args.backup_dir))
+            if filename.endswith("-timestamps.jpg") and not filename.startswith("._")
+        ]
+        run_corpus("real", descriptions, args.repeat)
+    else:
+        for version in ("v1", "v2", "v3"):
+            descriptions = [make_description(version, i, args.signs) for i in range(args.count)]
+            run_corpus(version, descriptions, args.repeat)
@@ -0,0 +1,99 @@
+# Micro-benchmark of exif_reader.read_image_description against the PIL path that
+# decode_split_by_length.py used before (Image.open + getexif + get_image_description below).
+#
+# Usage: python scripts/bench_exif_reader.py [--backup_dir DIR] [--count N] [--repeat R]
+# Without --backup_dir, N synthetic timestamps files are generated in a temp directory.
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from PIL import Image
+from PIL.ExifTags import TAGS
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from exif_reader import IMAGE_DESCRIPTION_TAG, read_image_description
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backup_dir", type=str, default=None, help="Directory of real -timestamps.jpg files")
+    parser.add_argument("--count", type=int, default=500, help="Number of synthetic files when no --backup_dir is given")
+    parser.add_argument("--repeat", type=int, default=3)
+    return parser.parse_args()
+
+
+def make_synthetic_files(directory, count):
+    recording = (
+        "(file=\\/storage\\/emulated\\/0\\/session.mp4, videoStart=2023_05_01_10_00_00.000, "
+        "signStart=2023_05_01_10_00_01.000, signEnd=2023_05_01_10_00_01.200, isValid=True, attempt=1)"
+    )
+    description = "{" + ", ".join(f'"sign{i}": "[{recording}]"' for i in range(40)) + "}"
+
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"uid-{i}-timestamps.jpg")
+        exif = Image.Exif()
+        exif[IMAGE_DESCRIPTION_TAG] = description
+        Image.new("RGB", (1080, 1920)).save(path, exif=exif)
+        paths.append(path)
+    return paths
+
+
+# The description reader decode_split_by_length.py had before exif_reader, kept as the baseline
+def get_image_description(exifdata):
+    description = ""
+    # iterating over all EXIF data fields
+    for tag_id in exifdata:
+        # get the tag name, instead of human unreadable tag id
+        tag = TAGS.get(tag_id, tag_id)
+        data = exifdata.get(tag_id)
+        # decode bytes
+        if isinstance(data, bytes):
+            data = data.decode()
+        # print(f"{tag:25}: {data}")
+        if tag == "ImageDescription":
+            description = data
+
+    #print("Image Description:", description)
+    return description
+
+
+def read_with_pil(path):
+    return get_image_description(Image.open(path).getexif())
+
+
+def bench(name, read, paths, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for path in paths:
+            read(path)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{name:>6}: {best:.3f}s for {len(paths)} files ({1e6 * best / len(paths):.1f} us/file)")
+    return best
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.backup_dir is not None:
+            paths = [
+                os.path.join(args.backup_dir, filename)
+                for filename in sorted(os.listdir(args.backup_dir))
+                if filename.endswith("-timestamps.jpg") and not filename.startswith("._")
+            ]
+        else:
+            paths = make_synthetic_files(tmp_dir, args.count)
+
+        mismatches = [path for path in paths if read_image_description(path) != read_with_pil(path)]
+        if mismatches:
+            print(f"{len(mismatches)} files differ from the PIL path, e.g. {mismatches[0]}")
+
+        pil_time = bench("pil", read_with_pil, paths, args.repeat)
+        fast_time = bench("fast", read_image_description, paths, args.repeat)
+        print(f"speedup: {pil_time / fast_time:.1f}x")
@@ -0,0 +1,256 @@
+# End to end benchmark of decode_split_by_length.py on synthetic data, so the pipeline can be
+# benchmarked offline on a CPU-only box without participant data from /data.
+#
+# Generates --sessions session videos (ffmpeg testsrc + a sine tone) with a matching
+# -timestamps.jpg each, whose EXIF ImageDescription is written in one of the recorder formats:
+# v1 (legacy, no isValid/attempt and unclosed recordings), v2 (isValid) and v3 (isValid +
+# attempt, with some signs recorded twice). Signs are taps (short press at the sign start) or holds
+# (button held for the whole sign), mixed by --hold_fraction. The same --seed always gives the same
+# dataset.
+#
+# The pipeline then runs --repeat times into a fresh dest_dir each time and the best run's
+# clips/sec, files/sec and peak RSS (the whole process tree: main process, pool workers and ffmpeg)
+# are reported, along with the per stage totals from its metrics report.
+#
+# Usage: python scripts/bench_pipeline.py [--sessions N] [--signs N] [--hold_fraction F]
+#            [--formats v1,v2,v3] [--data_dir DIR] [--json FILE] [-- decode_split_by_length args]
+# e.g. python scripts/bench_pipeline.py --sessions 20 -- --extract_mode source --num_threads 4
+import argparse
+import datetime
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from PIL import Image
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, REPO_DIR)
+
+from exif_reader import IMAGE_DESCRIPTION_TAG
+
+SIGN_NAMES = [
+    "apple", "don't", "pet's name", "Are you deaf.", "thank you", "mother / father",
+    "cat", "dog", "alone", "yes", "no", "water (drink)",
+]
+
+# How often the process tree's memory is sampled
+RSS_INTERVAL = 0.2
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=12, help="Synthetic session videos")
+    parser.add_argument("--signs", type=int, default=10, help="Signs per session")
+    parser.add_argument("--hold_fraction", type=float, default=0.3, help="Fraction of signs recorded by holding the button")
+    parser.add_argument("--formats", type=str, default="v1,v2,v3", help="Recorder formats the sessions cycle through")
+    parser.add_argument("--uids", type=int, default=3, help="Number of users the sessions are spread over")
+    parser.add_argument("--video_size", type=str, default="640x360")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--data_dir", type=str, default=None, help="Keep the synthetic data here (reused if it already exists) instead of a temp directory")
+    parser.add_argument("--json", type=str, default=None, help="Also write the results to this file")
+    parser.add_argument("decode_args", nargs=argparse.REMAINDER, help="Arguments passed on to decode_split_by_length.py after --")
+    args = parser.parse_args()
+
+    if args.decode_args and args.decode_args[0] == "--":
+        args.decode_args = args.decode_args[1:]
+    return args
+
+
+def timestamp(base, seconds):
+    t = base + datetime.timedelta(seconds=seconds)
+    return t.strftime("%Y_%m_%d_%H_%M_%S.") + f"{t.microsecond // 1000:03d}"
+
+
+# Returns [(sign, sign_start, sign_end, attempt, is_valid)] in seconds from the video start and the
+# video duration. Taps press the button briefly once the sign starts, holds keep it pressed for the
+# whole sign
+def make_session_signs(rng, signs, hold_fraction, with_attempts):
+    recordings = []
+    cursor = 0.5
+    for i in range(signs):
+        sign = SIGN_NAMES[i % len(SIGN_NAMES)] + ("" if i < len(SIGN_NAMES) else f" {i}")
+        for attempt in (1, 2) if with_attempts and rng.random() < 0.2 else (1,):
+            if rng.random() < hold_fraction:
+                start = cursor + rng.uniform(0.3, 0.8)
+                end = start + rng.uniform(1.5, 3.5)
+            else:
+                start = cursor + rng.uniform(1.0, 2.5)
+                end = start + rng.uniform(0.1, 0.4)
+            recordings.append((sign, start, end, attempt, rng.random() > 0.1))
+            cursor = end
+    return recordings, cursor + 1.0
+
+
+def make_description(version, video_name, base, recordings):
+    by_sign = {}
+    for sign, start, end, attempt, is_valid in recordings:
+        fields = (
+            f"file=\\/storage\\/emulated\\/0\\/Movies\\/{video_name}, videoStart={timestamp(base, 0)}, "
+            f"signStart={timestamp(base, start)}, signEnd={timestamp(base, end)}"
+        )
+        if version == "v1":
+            recording = f"({fields}, "
+        elif version == "v2":
+            recording = f"({fields}, isValid={is_valid})"
+        else:
+            recording = f"({fields}, isValid={is_valid}, attempt={attempt})"
+        by_sign.setdefault(sign, []).append(recording)
+
+    entries = [f'"{sign}": "[{", ".join(sign_recordings)}]"' for sign, sign_recordings in by_sign.items()]
+    if version == "v3":
+        entries.append('"version": 3')
+    return "{" + ", ".join(entries) + "}"
+
+
+def make_dataset(args, backup_dir):
+    rng = random.Random(args.seed)
+    formats = args.formats.split(",")
+    os.makedirs(backup_dir, exist_ok=True)
+
+    for i in range(args.sessions):
+        version = formats[i % len(formats)]
+        uid = f"4a.2.{1000 + i % args.uids}"
+        name = f"{uid}-session{i:04d}"
+        base = datetime.datetime(2023, 5, 1, 10, 0, 0) + datetime.timedelta(minutes=i)
+
+        recordings, duration = make_session_signs(rng, args.signs, args.hold_fraction, version == "v3")
+        subprocess.run(
+            [
+                "ffmpeg", "-v", "error", "-y",
+                "-f", "lavfi", "-i", f"testsrc=size={args.video_size}:rate=30",
+                "-f", "lavfi", "-i", f"sine=frequency={220 + 20 * i}",
+                "-t", f"{duration:.2f}",
+                "-c:v", "libx264", "-pix_fmt", "yuv420p", "-g", "30",
+                "-c:a", "aac",
+                os.path.join(backup_dir, name + ".mp4"),
+            ],
+            check=True,
+        )
+
+        exif = Image.Exif()
+        exif[IMAGE_DESCRIPTION_TAG] = make_description(version, name + ".mp4", base, recordings)
+        Image.new("RGB", (108, 192)).save(os.path.join(backup_dir, name + "-timestamps.jpg"), exif=exif)
+
+
+# Sum of VmRSS (in KB) over pid and all of its descendants, read from /proc
+def get_tree_rss(pid):
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name can contain spaces, the parent pid is the second field after it
+                parent = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(parent, []).append(int(entry))
+
+    rss = 0
+    pids = [pid]
+    while pids:
+        current = pids.pop()
+        pids.extend(children.get(current, []))
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        rss += int(line.split()[1])
+                        break
+        except OSError:
+            continue
+    return rss
+
+
+def run_pipeline(args, backup_dir, work_dir):
+    dest_dir = os.path.join(work_dir, "dest")
+    shutil.rmtree(dest_dir, ignore_errors=True)
+    metrics_file = os.path.join(work_dir, "metrics.json")
+
+    # decode_split_by_length.py reads config.json and writes logs/ in its working directory
+    with open(os.path.join(work_dir, "config.json"), "w") as f:
+        json.dump({}, f)
+
+    command = [
+        sys.executable, os.path.join(REPO_DIR, "decode_split_by_length.py"),
+        "--backup_dir", backup_dir,
+        "--dest_dir", dest_dir,
+        "--metrics_file", metrics_file,
+        "--ffmpeg_loglevel", "quiet",
+        *args.decode_args,
+    ]
+
+    peak_rss = 0
+    started = time.perf_counter()
+    process = subprocess.Popen(command, cwd=work_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def sample_rss():
+        nonlocal peak_rss
+        while process.poll() is None:
+            peak_rss = max(peak_rss, get_tree_rss(process.pid))
+            time.sleep(RSS_INTERVAL)
+
+    sampler = threading.Thread(target=sample_rss, daemon=True)
+    sampler.start()
+    returncode = process.wait()
+    elapsed = time.perf_counter() - started
+    sampler.join()
+
+    if returncode != 0:
+        raise RuntimeError(f"decode_split_by_length.py exited with {returncode}: {' '.join(command)}")
+
+    clip_count = sum(
+        1
+        for _, _, filenames in os.walk(dest_dir)
+        for filename in filenames
+        if filename.endswith(".mp4")
+    )
+    with open(metrics_file) as f:
+        stages = {stage: values["sum"] for stage, values in json.load(f)["stages"].items()}
+
+    return {"seconds": elapsed, "clips": clip_count, "peak_rss_mb": peak_rss / 1024, "stages": stages}
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = args.data_dir or os.path.join(tmp_dir, "data")
+        backup_dir = os.path.join(data_dir, "backup")
+        if not os.path.exists(backup_dir):
+            started = time.perf_counter()
+            make_dataset(args, backup_dir)
+            print(f"Generated {args.sessions} sessions in {time.perf_counter() - started:.1f}s")
+
+        file_count = sum(1 for filename in os.listdir(backup_dir) if filename.endswith("-timestamps.jpg"))
+        runs = [run_pipeline(args, backup_dir, tmp_dir) for _ in range(args.repeat)]
+        best = min(runs, key=lambda run: run["seconds"])
+
+        results = {
+            "decode_args": args.decode_args,
+            "files": file_count,
+            "clips": best["clips"],
+            "seconds": best["seconds"],
+            "clips_per_sec": best["clips"] / best["seconds"],
+            "files_per_sec": file_count / best["seconds"],
+            "peak_rss_mb": max(run["peak_rss_mb"] for run in runs),
+            "stages": best["stages"],
+        }
+
+        print(f"{file_count} files, {best['clips']} clips in {best['seconds']:.2f}s (best of {args.repeat})")
+        print(f"clips/sec: {results['clips_per_sec']:.2f}")
+        print(f"files/sec: {results['files_per_sec']:.2f}")
+        print(f"peak RSS : {results['peak_rss_mb']:.0f} MB")
+        for stage, seconds in best["stages"].items():
+            print(f"  {stage:>12}: {seconds:.3f}")
+
+        if args.json is not None:
+            with open(args.json, "w") as f:
+                json.dump(results, f, indent=2)
@@ -0,0 +1,38 @@
+# Prints what a --dedup_cache of decode_split_by_length.py holds: how many source videos it has
+# seen, how many of them are copies of each other, and how many clips were reused instead of being
+# extracted again.
+#
+# Usage: python scripts/dedup_stats.py CACHE [--json]
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from dedup_cache import DedupCache
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("cache", type=str, help="SQLite file passed as --dedup_cache")
+    parser.add_argument("--json", action="store_true", help="Print the stats as JSON")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if not os.path.exists(args.cache):
+        sys.exit(f"{args.cache} doesn't exist")
+
+    cache = DedupCache(args.cache)
+    stats = cache.stats()
+    cache.close()
+
+    if args.json:
+        print(json.dumps(stats, indent=2))
+    else:
+        print(f"sources       : {stats['sources']} ({stats['unique_sources']} unique)")
+        print(f"duplicated    : {len(stats['duplicated_sources'])} sources seen more than once")
+        print(f"clips         : {stats['clips']}")
+        print(f"reused clips  : {stats['reused_clips']}")
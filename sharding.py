@@ -0,0 +1,85 @@
+import heapq
+import math
+import subprocess
+
+# Estimated cost of starting ffmpeg and seeking for a clip, in seconds of encoded video. Keeps
+# sessions with many very short clips from looking free
+CLIP_OVERHEAD_COST = 1.0
+
+# Sessions costing more than this fraction of a shard's share are split into runs of clips, so a
+# single huge session can't hold up the whole array
+MAX_PIECE_FRACTION = 0.25
+
+
+# Duration of a source video in seconds from its container header, used as the cost of a session
+# when the timestamps can't be trusted (--shard_cost probe)
+def probe_duration(videopath):
+    result = subprocess.run(
+        [
+            "ffprobe",
+            "-v", "error",
+            "-show_entries", "format=duration",
+            "-of", "default=noprint_wrappers=1:nokey=1",
+            videopath,
+        ],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    return float(result.stdout.strip() or 0)
+
+
+def get_clip_cost(start, end):
+    return max(end - start, 0) + CLIP_OVERHEAD_COST
+
+
+# Splits the clips of one unit into contiguous runs (clips are in sign start order, so a run only
+# covers one stretch of the source) that each cost at most max_cost. Units with no clips still get
+# an empty piece so the unit is owned by exactly one shard (e.g. to log that it has no signs)
+def split_unit(costs, max_cost):
+    if not costs or max_cost <= 0 or sum(costs) <= max_cost:
+        return [list(range(len(costs)))]
+
+    piece_count = math.ceil(sum(costs) / max_cost)
+    piece_cost = sum(costs) / piece_count
+
+    pieces = [[]]
+    piece_total = 0
+    for i, cost in enumerate(costs):
+        if pieces[-1] and piece_total + cost / 2 > piece_cost and len(pieces) < piece_count:
+            pieces.append([])
+            piece_total = 0
+        pieces[-1].append(i)
+        piece_total += cost
+    return pieces
+
+
+# Splits units of work over num_shards so every shard gets about the same estimated cost. units is a
+# dict of key (timestamps file or source video) -> list of per clip costs. Pieces are handed out
+# largest first to the least loaded shard (LPT), with ties broken by key, so every array task
+# computes exactly the same assignment from the same listing without a pre-generated batch file.
+# Returns (shards, loads) where shards[i] is a dict of key -> sorted clip indices of shard i
+def assign_shards(units, num_shards):
+    total_cost = sum(sum(costs) for costs in units.values())
+    max_piece_cost = total_cost / num_shards * MAX_PIECE_FRACTION
+
+    pieces = []
+    for key in sorted(units):
+        costs = units[key]
+        for indices in split_unit(costs, max_piece_cost):
+            pieces.append((sum(costs[i] for i in indices), key, indices))
+    pieces.sort(key=lambda piece: (-piece[0], piece[1], piece[2][:1]))
+
+    shards = [{} for _ in range(num_shards)]
+    loads = [0.0] * num_shards
+    heap = [(0.0, shard) for shard in range(num_shards)]
+    for cost, key, indices in pieces:
+        load, shard = heapq.heappop(heap)
+        shards[shard].setdefault(key, []).extend(indices)
+        loads[shard] = load + cost
+        heapq.heappush(heap, (loads[shard], shard))
+
+    for shard in shards:
+        for indices in shard.values():
+            indices.sort()
+    return shards, loads
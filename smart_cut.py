@@ -0,0 +1,216 @@
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+
+# Offset (in seconds) used to keep seeks and cut points off of exact frame timestamps. ffprobe
+# rounds the timestamps it prints, so cutting right on one can gain or lose a frame
+EPSILON = 0.0005
+
+
+# Returns the codec of the first video stream and a list of (pts_time, is_keyframe) for every
+# video packet in presentation order. Only reads packet headers so nothing is decoded
+def probe_video_packets(videopath):
+    result = subprocess.run(
+        [
+            "ffprobe",
+            "-v", "error",
+            "-select_streams", "v:0",
+            "-show_entries", "stream=codec_name:packet=pts_time,flags",
+            "-of", "json",
+            videopath,
+        ],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    probe = json.loads(result.stdout)
+
+    streams = probe.get("streams", [])
+    codec = streams[0]["codec_name"] if streams else None
+    packets = sorted(
+        (float(packet["pts_time"]), "K" in packet["flags"])
+        for packet in probe.get("packets", [])
+        if packet.get("pts_time", "N/A") != "N/A"
+    )
+    return codec, packets
+
+
+# Phases (in frames) closer than this to half a frame are too close to call which output frame
+# ffmpeg's rounding puts a source frame on, those clips aren't smart cut
+ROUNDING_MARGIN = 0.05
+
+# Packet intervals may be off from the frame interval by this much (in frames) and still count as
+# a constant frame rate
+FRAME_RATE_TOLERANCE = 0.01
+
+# Parameter set id of the re-encoded pieces, x264's highest. Copied GOPs keep referring to the
+# source's SPS/PPS (nearly always id 0), which differ from libx264's, so the two sets need distinct
+# ids to both be usable in one stream
+ENCODED_SPS_ID = 31
+
+# Sample entry of smart cut clips. An avc1 entry must have every parameter set of the stream in its
+# avcC, while the clip switches between the source's and libx264's sets, avc3 is the entry that
+# allows (and the muxer keeps) parameter sets in-band
+SMART_CUT_TAG = "avc3"
+
+# The re-encoded pieces carry their SPS/PPS in-band on every keyframe, like the copied GOPs after
+# h264_mp4toannexb, so the decoder picks up each set as the pieces switch
+ENCODED_PIECE_ARGS = [
+    "-an", "-c:v", "libx264", "-x264-params", f"sps-id={ENCODED_SPS_ID}",
+    "-bsf:v", "dump_extra=freq=keyframe",
+]
+
+
+# Frame rate of the packets around [start, end) if they are evenly spaced, else None. It is averaged
+# over all of them since a single interval of ffprobe's rounded timestamps is off by up to 1e-6s,
+# enough to gain a frame in ceil(time * frame_rate)
+def get_constant_frame_rate(packets, start, end):
+    times = [pts for pts, _ in packets if start - 1 <= pts <= end + 1]
+    intervals = [b - a for a, b in zip(times, times[1:])]
+    if not intervals:
+        return None
+    interval = sorted(intervals)[len(intervals) // 2]
+    if interval <= 0 or any(abs(other - interval) > interval * FRAME_RATE_TOLERANCE for other in intervals):
+        return None
+    return len(intervals) / (times[-1] - times[0])
+
+
+# Plans a smart cut of [start, start + time) that gives the same frames as the full re-encode.
+# The re-encode (-ss start -i ... -t time into mp4) puts out ceil(time * frame_rate) constant rate
+# frames, output frame k showing the source frame whose (pts - start) * frame_rate rounds to k
+# (the first one repeated if it rounds to 1). So with a constant frame rate source, output frames
+# map 1:1 to source frames after the first, and a run of whole GOPs can be copied in between a
+# re-encoded head and tail. Returns (frame_rate, head_frames, copy_start, copy_frames, copy_end,
+# tail_frames) where copy_start/copy_end are keyframes, or None if the clip doesn't contain a whole
+# GOP or its frames can't be matched (variable frame rate, ambiguous rounding, clip past the end)
+def plan_smart_cut(packets, start, time):
+    frame_rate = get_constant_frame_rate(packets, start, start + time)
+    if frame_rate is None:
+        return None
+
+    frame_count = math.ceil(round(time * frame_rate, 3))
+    frames = []
+    for pts, is_key in packets:
+        if pts < start - EPSILON:
+            continue
+        position = (pts - start) * frame_rate
+        if abs(position % 1 - 0.5) < ROUNDING_MARGIN:
+            return None
+        index = math.floor(position + 0.5)
+        if index >= frame_count:
+            break
+        frames.append((pts, is_key, index))
+
+    # Every output frame needs its source frame, the first one can be repeated
+    if not frames or frames[-1][2] != frame_count - 1 or frames[0][2] > 1:
+        return None
+    if any(b[2] - a[2] != 1 for a, b in zip(frames, frames[1:])):
+        return None
+
+    keyframes = [(pts, index) for pts, is_key, index in frames if is_key]
+    if len(keyframes) < 2:
+        return None
+    (copy_start, head_frames), (copy_end, tail_start) = keyframes[0], keyframes[-1]
+    return frame_rate, head_frames, copy_start, tail_start - head_frames, copy_end, frame_count - tail_start
+
+
+# -threads for both the decoder (before -i) and the encoder (after it), nothing leaves it to ffmpeg
+def get_thread_args(threads):
+    return ["-threads", str(threads)] if threads else []
+
+
+# subprocess.run(command, check=True) with ffmpeg's log captured, so a failed run raises a
+# CalledProcessError whose stderr has the log for the report. The log is still passed on to stderr
+def run_captured(command, **kwargs):
+    result = subprocess.run(command, stderr=subprocess.PIPE, **kwargs)
+    sys.stderr.write(result.stderr.decode(errors="replace"))
+    result.check_returncode()
+    return result
+
+
+def run_ffmpeg(loglevel, *ffmpeg_args):
+    run_captured(["ffmpeg", "-y", "-nostdin", "-loglevel", loglevel, *ffmpeg_args])
+
+
+# Cuts [start, start + time) out of videopath by stream copying the GOPs that are fully inside the
+# clip and only re-encoding the partial GOPs at the head and tail, with the same frames, timestamps
+# and audio as the full re-encode in decode_split_by_length.run_clip (see plan_smart_cut).
+#
+# The pieces are video only NUT files, which keep the exact timestamps of every piece (Matroska
+# rounds them to milliseconds), with the SPS/PPS of both the source and libx264 in-band (see
+# ENCODED_SPS_ID) so the copied GOPs still decode after the re-encoded head. The head is cut with the
+# same -ss/-t and constant frame rate as the full re-encode so it starts on the same frames, the
+# first one repeated included. The pieces are joined with the concat demuxer with the exact
+# duration of every piece, so the frames stay evenly spaced across the joins, and the audio of the
+# clip is encoded once while muxing into an avc3 mp4 (see SMART_CUT_TAG). Returns False without
+# writing anything when smart cutting isn't possible (not h264, negative start, or see
+# plan_smart_cut) so the caller can fall back to a full re-encode. threads: optional ffmpeg
+# -threads for the re-encoded pieces
+def smart_cut_clip(videopath, start, time, output, loglevel="fatal", probe=None, threads=None):
+    codec, packets = probe if probe is not None else probe_video_packets(videopath)
+
+    start = round(start, 2)
+    time = round(time, 2)
+    if codec != "h264" or start <= 0:
+        return False
+
+    cut = plan_smart_cut(packets, start, time)
+    if cut is None:
+        return False
+    frame_rate, head_frames, copy_start, copy_frames, copy_end, tail_frames = cut
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        segments = []
+
+        if head_frames:
+            head = os.path.join(tmp_dir, "head.nut")
+            run_ffmpeg(
+                loglevel,
+                *get_thread_args(threads), "-ss", f"{start:.2f}", "-i", videopath,
+                "-t", f"{time:.2f}", "-frames:v", str(head_frames), "-fps_mode", "cfr",
+                *ENCODED_PIECE_ARGS, *get_thread_args(threads),
+                head,
+            )
+            segments.append((head, head_frames))
+
+        # -frames:v stops the copy exactly at copy_end since the copied GOPs are never reordered
+        # across a keyframe
+        middle = os.path.join(tmp_dir, "middle.nut")
+        run_ffmpeg(
+            loglevel,
+            "-ss", f"{copy_start + EPSILON:.4f}", "-i", videopath,
+            "-frames:v", str(copy_frames),
+            "-an", "-c:v", "copy", "-bsf:v", "h264_mp4toannexb",
+            middle,
+        )
+        segments.append((middle, copy_frames))
+
+        if tail_frames:
+            tail = os.path.join(tmp_dir, "tail.nut")
+            run_ffmpeg(
+                loglevel,
+                *get_thread_args(threads), "-ss", f"{copy_end - EPSILON:.4f}", "-i", videopath,
+                "-frames:v", str(tail_frames),
+                *ENCODED_PIECE_ARGS, *get_thread_args(threads),
+                tail,
+            )
+            segments.append((tail, tail_frames))
+
+        concat_list = os.path.join(tmp_dir, "segments.txt")
+        with open(concat_list, "w") as f:
+            for segment, frames in segments:
+                f.write(f"file '{segment}'\nduration {frames / frame_rate:.6f}\n")
+
+        run_ffmpeg(
+            loglevel,
+            "-f", "concat", "-safe", "0", "-i", concat_list,
+            "-ss", f"{start:.2f}", "-t", f"{time:.2f}", "-i", videopath,
+            "-map", "0:v", "-map", "1:a?",
+            "-c:v", "copy", "-tag:v", SMART_CUT_TAG, "-c:a", "aac",
+            "-f", "mp4", output,
+        )
+
+    return True
@@ -0,0 +1,76 @@
+import datetime
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+from PIL import Image
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+# Tag the recorder writes the timestamps description to
+IMAGE_DESCRIPTION = 0x010E
+
+requires_ffmpeg = pytest.mark.skipif(
+    shutil.which("ffmpeg") is None or shutil.which("ffprobe") is None, reason="needs ffmpeg and ffprobe"
+)
+
+
+def format_timestamp(base, seconds):
+    timestamp = base + datetime.timedelta(seconds=seconds)
+    return timestamp.strftime("%Y_%m_%d_%H_%M_%S.") + f"{timestamp.microsecond // 1000:03d}"
+
+
+# Writes a test source (testsrc at 30 fps with a keyframe every second, plus a sine) to path
+def make_source(path, duration, size="320x240"):
+    subprocess.run(
+        [
+            "ffmpeg", "-v", "error", "-y",
+            "-f", "lavfi", "-i", f"testsrc=size={size}:rate=30",
+            "-f", "lavfi", "-i", "sine",
+            "-t", str(duration),
+            "-c:v", "libx264", "-g", "30", "-c:a", "aac",
+            path,
+        ],
+        check=True,
+    )
+
+
+# Writes a recorder session to backup_dir: (uid)-(session).mp4 and its -timestamps.jpg with one
+# recording per (sign, sign_start, sign_end) in seconds from the start of the video
+def make_session(backup_dir, uid, session, signs, duration=9):
+    name = f"{uid}-{session}"
+    make_source(os.path.join(backup_dir, name + ".mp4"), duration)
+
+    base = datetime.datetime(2023, 5, 1, 10, 0, 0)
+    recordings = {}
+    for sign, sign_start, sign_end in signs:
+        recordings.setdefault(sign, []).append(
+            f"(file=\\/sdcard\\/{name}.mp4, videoStart={format_timestamp(base, 0)}, "
+            f"signStart={format_timestamp(base, sign_start)}, signEnd={format_timestamp(base, sign_end)}, "
+            f"isValid=True, attempt={len(recordings.get(sign, [])) + 1})"
+        )
+    description = "{" + ", ".join(f'"{sign}": "[' + ", ".join(values) + ']"' for sign, values in recordings.items()) + "}"
+
+    image = Image.new("RGB", (8, 8))
+    exif = Image.Exif()
+    exif[IMAGE_DESCRIPTION] = description
+    image.save(os.path.join(backup_dir, name + "-timestamps.jpg"), exif=exif)
+    return os.path.join(backup_dir, name + ".mp4")
+
+
+# Runs decode_split_by_length.py in work_dir (which gets the empty config.json it reads)
+def run_decode(work_dir, *args):
+    config = os.path.join(work_dir, "config.json")
+    if not os.path.exists(config):
+        with open(config, "w") as f:
+            json.dump({}, f)
+    return subprocess.run(
+        [sys.executable, os.path.join(REPO_DIR, "decode_split_by_length.py"), *args],
+        cwd=work_dir,
+        capture_output=True,
+        text=True,
+    )
@@ -0,0 +1,22 @@
+import json
+
+from conftest import make_session, requires_ffmpeg, run_decode
+
+SIGNS = [("ice cream", 1.0, 1.2), ("ice-cream", 2.5, 2.6), ("thank you", 4.0, 6.0)]
+
+
+@requires_ffmpeg
+def test_inventory_is_keyed_by_the_cleaned_sign(tmp_path):
+    backup_dir = tmp_path / "backup"
+    backup_dir.mkdir()
+    make_session(str(backup_dir), "4a.2.1032", "s1", SIGNS)
+
+    result = run_decode(str(tmp_path), "scan", "--backup_dir", str(backup_dir), "--dest_dir", str(tmp_path / "dest"))
+    assert result.returncode == 0, result.stderr
+    with open(tmp_path / "dest" / "inventory.json") as f:
+        signs = json.load(f)["uids"]["4a.2.1032"]["signs"]
+
+    # Both spellings of ice cream end up in the same clip directory, so they share a key
+    assert sorted(signs) == ["icecream", "thankyou"]
+    assert signs["icecream"]["recordings"] == 2
+    assert signs["thankyou"]["recordings"] == 1
@@ -0,0 +1,38 @@
+import os
+
+import pytest
+
+from conftest import make_session, requires_ffmpeg, run_decode
+
+SIGNS = [("apple", 1.0, 1.2), ("cat", 2.5, 2.6), ("dog", 4.0, 6.0)]
+
+
+@requires_ffmpeg
+@pytest.mark.parametrize("probe", [[], ["--probe"]])
+def test_probe_cost_shards_sessions_with_a_corrupt_source(tmp_path, probe):
+    backup_dir = tmp_path / "backup"
+    backup_dir.mkdir()
+    make_session(str(backup_dir), "4a.2.1032", "s1", SIGNS)
+    corrupt = make_session(str(backup_dir), "4a.2.1032", "s2", SIGNS)
+    with open(corrupt, "rb") as f:
+        head = f.read(20000)
+    with open(corrupt, "wb") as f:
+        f.write(head)
+
+    clip_counts = []
+    for shard in range(2):
+        result = run_decode(
+            str(tmp_path), "plan",
+            "--backup_dir", str(backup_dir),
+            "--dest_dir", str(tmp_path / "dest"),
+            "--manifest", str(tmp_path / f"manifest_{shard}.jsonl"),
+            "--num_shards", "2", "--job_array_num", str(shard),
+            "--shard_cost", "probe",
+            *probe,
+        )
+        assert result.returncode == 0, result.stderr
+        with open(tmp_path / f"manifest_{shard}.jsonl") as f:
+            clip_counts.append(sum(1 for _ in f))
+
+    # Every clip of both sessions is in exactly one shard, the corrupt one included
+    assert sum(clip_counts) == 2 * len(SIGNS)
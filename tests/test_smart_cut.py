@@ -0,0 +1,80 @@
+import json
+import struct
+import subprocess
+
+from conftest import make_source, requires_ffmpeg
+
+from smart_cut import probe_video_packets, smart_cut_clip
+
+# Boxes on the way from the top of an mp4 to the sample descriptions of its tracks
+SAMPLE_DESCRIPTION_PATH = (b"moov", b"trak", b"mdia", b"minf", b"stbl", b"stsd")
+
+
+def iter_boxes(data, start=0, end=None):
+    end = len(data) if end is None else end
+    while start + 8 <= end:
+        size, box_type = struct.unpack(">I4s", data[start:start + 8])
+        yield box_type, start + 8, start + size
+        start += size
+
+
+# (sample entry type, types of the boxes inside it) of every track of an mp4
+def get_sample_entries(path):
+    with open(path, "rb") as f:
+        data = f.read()
+
+    boxes = [(0, len(data))]
+    for box_type in SAMPLE_DESCRIPTION_PATH:
+        boxes = [
+            (child_start, child_end)
+            for start, end in boxes
+            for child_type, child_start, child_end in iter_boxes(data, start, end)
+            if child_type == box_type
+        ]
+
+    entries = []
+    for start, end in boxes:
+        # Full box header and entry count, then the entries. A visual sample entry has 78 bytes of
+        # fields before its child boxes
+        for entry_type, entry_start, entry_end in iter_boxes(data, start + 8, end):
+            children = [child_type for child_type, _, _ in iter_boxes(data, entry_start + 78, entry_end)]
+            entries.append((entry_type, children))
+    return entries
+
+
+def get_frame_times(path):
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries", "frame=pts_time", "-of", "json", path],
+        capture_output=True, check=True, text=True,
+    )
+    return [float(frame["pts_time"]) for frame in json.loads(result.stdout)["frames"]]
+
+
+@requires_ffmpeg
+def test_smart_cut_is_avc3_with_the_frames_of_the_full_re_encode(tmp_path):
+    source = str(tmp_path / "source.mp4")
+    make_source(source, 9)
+    smart = str(tmp_path / "smart.mp4")
+    encoded = str(tmp_path / "encoded.mp4")
+    start, time = 1.03, 4.15
+
+    assert smart_cut_clip(source, start, time, smart, "error", probe_video_packets(source))
+    subprocess.run(
+        ["ffmpeg", "-v", "error", "-y", "-ss", f"{start:.2f}", "-i", source, "-t", f"{time:.2f}", "-c:v", "libx264", "-f", "mp4", encoded],
+        check=True,
+    )
+
+    # The clip switches between the source's and libx264's parameter sets, which only an avc3
+    # sample entry allows in-band
+    video_entries = [entry for entry in get_sample_entries(smart) if entry[0].startswith(b"avc")]
+    assert len(video_entries) == 1
+    entry_type, children = video_entries[0]
+    assert entry_type == b"avc3"
+    assert b"avcC" in children
+
+    smart_times, encoded_times = get_frame_times(smart), get_frame_times(encoded)
+    assert len(smart_times) == len(encoded_times)
+    assert max(abs(a - b) for a, b in zip(smart_times, encoded_times)) < 0.002
+
+    errors = subprocess.run(["ffmpeg", "-v", "error", "-i", smart, "-f", "null", "-"], capture_output=True, text=True).stderr
+    assert errors == ""
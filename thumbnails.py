@@ -0,0 +1,95 @@
+import math
+import os
+import shlex
+
+from PIL import Image
+
+from smart_cut import get_thread_args, run_ffmpeg
+
+# Frames per row of a sprite sheet
+SPRITE_COLUMNS = 5
+
+THUMBNAIL_QUALITY = 5
+
+# Index of the thumbnails in --thumbnail_dir, see get_index_entry
+THUMBNAIL_INDEX_FILENAME = "index.jsonl"
+
+# Shortest sprite duration. Shorter clips round to -t 0.00, and the fps filter's frames/0.00 makes
+# ffmpeg fail, so their sprite is taken from the first 0.01s
+MIN_SPRITE_TIME = 0.01
+
+
+# Posters and sprite sheets mirror the layout of the clips under --dest_dir in --thumbnail_dir:
+# (clip name).jpg is the poster and (clip name)-sprite.jpg the sprite sheet
+def get_thumbnail_paths(args, output):
+    base = os.path.splitext(os.path.join(args.thumbnail_dir, os.path.relpath(output, args.dest_dir)))[0]
+    return base + ".jpg", base + "-sprite.jpg"
+
+
+def get_sprite_grid(frames):
+    columns = min(frames, SPRITE_COLUMNS)
+    return columns, math.ceil(frames / columns)
+
+
+# Single jpeg output options. The thumbnails are written to .part files, so the format and codec
+# can't be guessed from the extension
+def get_image_output_args(path):
+    return ["-an", "-frames:v", "1", "-c:v", "mjpeg", "-q:v", str(THUMBNAIL_QUALITY), "-f", "image2", "-update", "1", path]
+
+
+# ffmpeg output options for the poster, the middle frame of the clip, and the sprite sheet of
+# `frames` evenly spaced frames, both --thumbnail_width wide. offset: start of the clip in the
+# decoded input, when the input isn't seeked to the clip itself (run_clips_from_source)
+def get_thumbnail_output_args(width, frames, time, poster, sprite, offset=0):
+    columns, rows = get_sprite_grid(frames)
+    sprite_time = max(time, MIN_SPRITE_TIME)
+    return [
+        "-ss", f"{offset + time / 2:.2f}",
+        "-vf", f"scale={width}:-2",
+        *get_image_output_args(poster),
+        "-ss", f"{offset:.2f}",
+        "-t", f"{sprite_time:.2f}",
+        "-vf", f"fps={frames}/{sprite_time:.2f},scale={width}:-2,tile={columns}x{rows}",
+        *get_image_output_args(sprite),
+    ]
+
+
+# Same as get_thumbnail_output_args for the shell command of decode_split_by_length.run_clip
+def get_thumbnail_shell_args(width, frames, time, poster, sprite):
+    return shlex.join(get_thumbnail_output_args(width, frames, time, poster, sprite))
+
+
+# Makes the thumbnails of a clip that was already written, for the cut modes/backends that don't
+# decode the clip in a single ffmpeg process (--cut_mode smart, --use_cuda, --backend av)
+def make_thumbnails(clip_path, width, frames, time, poster, sprite, loglevel="fatal", threads=None):
+    run_ffmpeg(
+        loglevel,
+        *get_thread_args(threads), "-i", clip_path,
+        *get_thumbnail_output_args(width, frames, time, poster, sprite),
+    )
+
+
+# Index entry of a clip: its poster and sprite sheet and the time (in seconds from the start of the
+# clip) and x/y/w/h box of every frame of the sprite sheet. The clip path is relative to --dest_dir
+# and the thumbnail paths to --thumbnail_dir. Only the sprite's header is read to get the frame size
+def get_index_entry(args, output, time):
+    poster, sprite = get_thumbnail_paths(args, output)
+    columns, rows = get_sprite_grid(args.sprite_frames)
+    with Image.open(sprite) as image:
+        width, height = image.width // columns, image.height // rows
+
+    return {
+        "clip": os.path.relpath(output, args.dest_dir),
+        "poster": os.path.relpath(poster, args.thumbnail_dir),
+        "sprite": os.path.relpath(sprite, args.thumbnail_dir),
+        "frames": [
+            {
+                "time": round(i * time / args.sprite_frames, 3),
+                "x": (i % columns) * width,
+                "y": (i // columns) * height,
+                "w": width,
+                "h": height,
+            }
+            for i in range(args.sprite_frames)
+        ],
+    }